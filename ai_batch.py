@@ -0,0 +1,50 @@
+"""
+    Batch decisions
+    ===============
+
+    AIs decide on one revolution at a time with decide(bot, image, map). An AI may also offer
+    decide_batch(bot, images, map), taking an (N, 360) array with one revolution per row and
+    returning {'angle': array, 'speed': array} with one entry per row. decide_batch here uses
+    it when present and falls back to calling decide once per row otherwise, so offline
+    evaluation, replay and parameter sweeps work with every AI.
+    """
+
+import numpy as np
+from driver import arcade_batch
+
+
+def stack(frames):
+    """
+    Returns the distances of frames, ScanFrames or (360, 2) images, as an (N, 360) array.
+    """
+    return np.stack([np.asarray(frame)[:, 0] for frame in frames])
+
+
+def decide_batch(ai, bot, images, map):
+    """
+    Lets ai decide on every row of images, returns arrays of angles and speeds.
+    """
+    images = np.asarray(images)
+    if hasattr(ai, 'decide_batch'):
+        decisions = ai.decide_batch(bot, images, map)
+        return {'angle': np.asarray(decisions['angle'], dtype=float),
+                'speed': np.asarray(decisions['speed'], dtype=float)}
+
+    angles = np.empty(len(images))
+    speeds = np.empty(len(images))
+    for i, image in enumerate(images):
+        decision = ai.decide(bot, image, map)
+        angles[i] = decision['angle']
+        speeds[i] = decision['speed']
+    return {'angle': angles, 'speed': speeds}
+
+
+def drive_batch(decisions):
+    """
+    Turns decisions into motor values the way LidarBot.process does, returns arrays of left
+    and right.
+    """
+    speeds = np.clip(decisions['speed'], -1, 1)
+    angles = np.clip(decisions['angle'], -1, 1)
+    left, right = arcade_batch(speeds, angles)
+    return np.clip(left, -1, 1), np.clip(right, -1, 1)
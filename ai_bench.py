@@ -0,0 +1,298 @@
+"""
+    AI benchmark
+    ============
+
+    Runs an AI module over a fixed corpus of revolutions and reports how fast and how lean its
+    decide is, so a slower AI shows up before the robot starts missing revolutions.
+
+    The corpus comes from a capture file of ciNeuroBotLidar (--capture), the revolution of
+    dummy_lidar (--dummy) or revolutions ray cast from random free poses of the map
+    (--synthetic, the default), and is the same for every run with the same arguments.
+
+    An untimed pass with a separate AI warms up imports and caches, then the first timed pass
+    over the corpus records every decision and, with --repeat, further passes add latencies.
+    A last pass with a fresh AI runs under tracemalloc, which slows decide down too much to
+    time it, for the peak bytes of every call above what was held before it, the bytes still
+    held after the pass and the peak memory of the pass.
+
+    --save writes the results and decisions to a JSON file, --baseline compares against one
+    and exits with status 1 when a decision changed or p99 latency grew by more than
+    --max-slowdown, or when the baseline was taken with another AI or AI_CONFIG.
+
+    $ python3 ai_bench.py --ai vfh_ai --synthetic 500 --repeat 3 --save baseline.json
+    $ python3 ai_bench.py --ai vfh_ai --synthetic 500 --repeat 3 --baseline baseline.json
+    """
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import raycast
+from capture import read_capture
+from ciNeuroBotLidar import decode_packets, unpack_readings
+from fake_neato import MIN_RANGE, MAX_RANGE
+from scan import ScanStore
+from simulator import SimBot, load_ai, start_poses
+from startup import load_map
+
+SCALE = 20.0  # mm per map unit
+TOLERANCE = 1e-9  # change of angle or speed that counts as a different decision
+
+
+def capture_scans(path):
+    """
+    Decodes every revolution of a capture file, returns an (N, 360, 2) array of distances and
+    qualities.
+    """
+    store = ScanStore()
+    scans = []
+    buf = b''
+    for stamp, data in read_capture(path):
+        buf += data
+        packets, _, consumed, _ = decode_packets(buf)
+        buf = buf[consumed:]
+        if len(packets) == 0:
+            continue
+        seen = store.seq
+        angles, dists, quals, flags = unpack_readings(packets)
+        store.write(angles, dists, quals, flags, stamp)
+        # a chunk may complete more than one revolution, the store keeps the last few
+        for seq in range(max(seen + 1, store.seq - store.depth + 2), store.seq + 1):
+            scans.append(store.image[int(np.flatnonzero(store.seqs == seq)[0])].copy())
+    return np.array(scans, dtype=np.int32).reshape(-1, store.size, 2)
+
+
+def dummy_scans(count):
+    """
+    Returns the revolution of dummy_lidar count times.
+    """
+    import dummy_lidar
+    image = np.asarray(dummy_lidar.Lidar().latest().image)
+    return np.repeat(image[None].astype(np.int32), count, axis=0)
+
+
+def synthetic_scans(map, position, direction, count, noise, config, seed):
+    """
+    Ray casts a revolution from the start pose and count - 1 random free poses of the map.
+
+    Returns the (N, 360, 2) scans and the poses they were cast from, distances outside the
+    range of the lidar are invalid and qualities fall off with the square of the distance like
+    the ones of fake_neato.
+    """
+    random = np.random.default_rng(seed)
+    scale = config.get('SCALE', SCALE)
+    segments = raycast.load_segments(map) * scale
+    poses = start_poses(map, position, direction, count, config, seed)
+
+    scans = np.zeros((count, 360, 2), dtype=np.int32)
+    for i, (position, direction) in enumerate(poses):
+        xy = np.asarray(position) * scale
+        dists = raycast.cast(segments, xy, raycast.beam_angles(raycast.heading(direction)), MAX_RANGE + 1)
+        if noise > 0:
+            dists = dists + random.normal(0, noise, dists.shape)
+        invalid = (dists < MIN_RANGE) | (dists > MAX_RANGE)
+        scans[i, :, 0] = np.where(invalid, 0, np.round(dists))
+        scans[i, :, 1] = np.where(invalid, 0, 2e8 / np.maximum(dists, MIN_RANGE) ** 2)
+    return scans, poses
+
+
+def fingerprint(scans):
+    return hashlib.sha1(np.ascontiguousarray(scans).tobytes()).hexdigest()
+
+
+def run_pass(ai, bots, scans, map, latencies=None, decisions=None):
+    """
+    Hands every revolution to ai.decide like LidarBot.process does.
+    """
+    for bot, scan in zip(bots, scans):
+        bot.qualities = scan[:, 1]
+        start = time.perf_counter()
+        decision = ai.decide(bot, scan[:, 0], map)
+        elapsed = time.perf_counter() - start
+        if latencies is not None:
+            latencies.append(elapsed)
+        if decisions is not None:
+            decisions.append((float(decision['angle']), float(decision['speed'])))
+
+
+def memory_pass(ai, bots, scans, map):
+    """
+    Returns the mean and largest peak bytes of a call of decide above what was held before
+    it, the bytes still held after all calls and the peak over the pass above what was held
+    before it.
+    """
+    tracemalloc.start()
+    try:
+        base = tracemalloc.get_traced_memory()[0]
+        call_peaks = []
+        peak = 0
+        for bot, scan in zip(bots, scans):
+            bot.qualities = scan[:, 1]
+            tracemalloc.reset_peak()
+            before = tracemalloc.get_traced_memory()[0]
+            ai.decide(bot, scan[:, 0], map)
+            after, call_peak = tracemalloc.get_traced_memory()
+            call_peaks.append(call_peak - before)
+            peak = max(peak, call_peak - base)
+        retained = after - base
+    finally:
+        tracemalloc.stop()
+    return {
+        'peak_bytes_per_call': float(np.mean(call_peaks)),
+        'peak_bytes_per_call_max': int(max(call_peaks)),
+        'retained_bytes': int(retained),
+        'peak_bytes': int(peak),
+    }
+
+
+def benchmark(ai_name, ai_config, scans, map, poses, repeat=1):
+    """
+    Benchmarks an AI over scans, returns its results and decisions.
+
+    poses -- (position, direction) of the bot for every revolution
+    """
+    bots = [SimBot(position, direction) for position, direction in poses]
+    run_pass(load_ai(ai_name, ai_config), bots, scans, map)
+
+    ai = load_ai(ai_name, ai_config)
+    latencies, decisions = [], []
+    start = time.perf_counter()
+    run_pass(ai, bots, scans, map, latencies, decisions)
+    for _ in range(repeat - 1):
+        run_pass(ai, bots, scans, map, latencies)
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000.0
+    results = {
+        'ai': ai_name,
+        'ai_config': ai_config,
+        'corpus': fingerprint(scans),
+        'scans': len(scans),
+        'calls': len(latencies),
+        'decisions_per_s': len(latencies) / elapsed if elapsed > 0 else math.inf,
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p99_ms': float(np.percentile(latencies_ms, 99)),
+        'max_ms': float(latencies_ms.max()),
+    }
+    results.update(memory_pass(load_ai(ai_name, ai_config), bots, scans, map))
+    return results, decisions
+
+
+def check_baseline(baseline, ai_name, ai_config):
+    """
+    Raises ValueError if the baseline was taken with another AI or AI_CONFIG.
+    """
+    for key, value in (('ai', ai_name), ('ai_config', ai_config)):
+        if baseline.get(key) != value:
+            raise ValueError('the baseline was taken with {} {}, not {}'.format(
+                key, json.dumps(baseline.get(key)), json.dumps(value)))
+
+
+def compare(results, decisions, baseline, max_slowdown):
+    """
+    Prints the differences to a baseline, returns whether the results regressed.
+
+    Raises ValueError if the baseline was taken with another AI or AI_CONFIG.
+    """
+    check_baseline(baseline, results['ai'], results['ai_config'])
+    regressed = False
+    print('{:>24} {:>12} {:>12} {:>8}'.format('', 'baseline', 'now', 'ratio'))
+    for key in ('decisions_per_s', 'p50_ms', 'p99_ms', 'max_ms', 'peak_bytes_per_call',
+                'peak_bytes_per_call_max', 'retained_bytes', 'peak_bytes'):
+        old, new = baseline[key], results[key]
+        ratio = new / old if old else math.inf if new else 1.0
+        print('{:>24} {:12.3f} {:12.3f} {:7.2f}x'.format(key, old, new, ratio))
+
+    slowdown = results['p99_ms'] / baseline['p99_ms'] if baseline['p99_ms'] else 1.0
+    if slowdown > max_slowdown:
+        print('p99 latency grew {:.2f}x, more than {:.2f}x'.format(slowdown, max_slowdown))
+        regressed = True
+
+    if baseline['corpus'] != results['corpus']:
+        print('the baseline was taken on other revolutions, decisions not compared')
+        return regressed
+
+    old = np.array(baseline['decisions'], dtype=np.float64).reshape(-1, 2)
+    new = np.array(decisions, dtype=np.float64).reshape(-1, 2)
+    changed = np.flatnonzero(np.abs(old - new).max(axis=1) > TOLERANCE)
+    if len(changed) > 0:
+        regressed = True
+        print('{} of {} decisions changed, max angle change {:.4f}, max speed change {:.4f}'.format(
+            len(changed), len(old), np.abs(old - new)[:, 0].max(), np.abs(old - new)[:, 1].max()))
+        for i in changed[:5]:
+            print('  revolution {}: angle {:.4f} -> {:.4f}, speed {:.4f} -> {:.4f}'.format(
+                i, old[i, 0], new[i, 0], old[i, 1], new[i, 1]))
+    else:
+        print('all {} decisions match the baseline'.format(len(old)))
+    return regressed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark an AI module over a corpus of revolutions.')
+    parser.add_argument('--config', default=os.environ.get('BOT_CONFIG', 'data/config.json'))
+    parser.add_argument('--ai', help='AI module, AI by default')
+    parser.add_argument('--ai-config', help='JSON AI_CONFIG, the one of the config file by default')
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument('--capture', help='capture file of ciNeuroBotLidar')
+    source.add_argument('--dummy', type=int, metavar='N', help='the dummy_lidar revolution N times')
+    source.add_argument('--synthetic', type=int, metavar='N', help='N revolutions ray cast in the map')
+    parser.add_argument('--noise', type=float, default=10.0, help='distance noise in mm of --synthetic')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=1, help='timed passes over the corpus')
+    parser.add_argument('--save', help='write the results and decisions to this file')
+    parser.add_argument('--baseline', help='compare against results written by --save')
+    parser.add_argument('--max-slowdown', type=float, default=1.25,
+                        help='p99 latency ratio to the baseline that counts as a regression')
+    args = parser.parse_args()
+
+    with open(args.config) as config_file:
+        config = json.load(config_file)
+    cache_dir = config.get('CACHE_DIR', os.path.join(os.path.dirname(args.config), 'cache'))
+    map = load_map(os.path.join(os.path.dirname(args.config), config['MAP']), cache_dir)
+    ai_name = args.ai or config['AI']
+    ai_config = json.loads(args.ai_config) if args.ai_config else config.get('AI_CONFIG')
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        try:
+            check_baseline(baseline, ai_name, ai_config)
+        except ValueError as e:
+            sys.exit(str(e))
+
+    start_pose = (config['START_POS'], config['START_DIR'])
+    if args.capture:
+        scans = capture_scans(args.capture)
+        poses = [start_pose] * len(scans)
+    elif args.dummy:
+        scans = dummy_scans(args.dummy)
+        poses = [start_pose] * len(scans)
+    else:
+        scans, poses = synthetic_scans(map, *start_pose, args.synthetic or 200, args.noise,
+                                       config.get('SIMULATOR', {}), args.seed)
+    if len(scans) == 0:
+        sys.exit('no revolutions in the corpus')
+
+    results, decisions = benchmark(ai_name, ai_config, scans, map, poses, args.repeat)
+    print('{} over {} revolutions, {} calls'.format(ai_name, results['scans'], results['calls']))
+    print('{:.0f} decisions/s, p50 {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms'.format(
+        results['decisions_per_s'], results['p50_ms'], results['p99_ms'], results['max_ms']))
+    print('{:.0f} peak bytes per call (max {}), {} bytes retained, {} bytes peak'.format(
+        results['peak_bytes_per_call'], results['peak_bytes_per_call_max'], results['retained_bytes'],
+        results['peak_bytes']))
+
+    regressed = False
+    if baseline is not None:
+        regressed = compare(results, decisions, baseline, args.max_slowdown)
+    if args.save:
+        with open(args.save, 'w') as save_file:
+            json.dump(dict(results, decisions=decisions), save_file)
+    sys.exit(1 if regressed else 0)
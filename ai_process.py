@@ -0,0 +1,209 @@
+"""
+    Process-isolated AI
+    ===================
+
+    Runs the AI module in a worker process of its own, so a slow decide does not hold the
+    GIL the lidar reader and the watchdog need.
+
+    Scans are written to a ring of slots in shared memory, together with bot.qualities and
+    bot.confidence when the bot has them, and only the slot number, the pose of the bot and a
+    sequence number go through a pipe. The worker answers with the
+    decision and its sequence number. At most one scan is outstanding: a scan arriving while
+    the worker is still busy waits for that answer first.
+
+    When no answer arrives within TIMEOUT the previous decision stays in effect, and after
+    MAX_MISSES misses in a row FALLBACK is used until the worker catches up.
+
+    The map is sent once, so map.grid and map.planner of a live map would be lost or stale in
+    the worker; main.load_ai refuses AI_PROCESS together with OCCUPANCY or PLANNER.
+    """
+
+import multiprocessing
+import signal
+import time
+import traceback
+from multiprocessing import shared_memory
+from types import SimpleNamespace
+
+import numpy as np
+from timing import Histogram
+
+TIMEOUT = 0.1  # seconds
+MAX_MISSES = 3
+FALLBACK = {'angle': 0, 'speed': 0}
+SLOTS = 2
+SIZE = 360  # samples per scan
+# rows of a slot, bot attributes other than the distances are only sent when the bot has them
+CHANNELS = ('distances', 'qualities', 'confidence')
+
+
+def serve(conn, shm_name, slots, size, ai_name, ai_config):
+    """
+    Main function of the worker process.
+    """
+    # ctrl-c reaches the whole process group, the parent shuts the worker down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    ring = np.ndarray((slots, len(CHANNELS), size), dtype=np.float64, buffer=shm.buf)
+    ai_module = __import__(ai_name)
+    ai = ai_module.AI(ai_config) if ai_config is not None else ai_module.AI()
+    map = None
+
+    try:
+        while True:
+            message = conn.recv()
+            if message is None:
+                break
+            seq, slot, length, state, new_map = message
+            if new_map is not None:
+                map = new_map
+
+            image = ring[slot, 0, :length].copy()
+            for row, name in enumerate(CHANNELS[1:], 1):
+                state[name] = ring[slot, row, :length].copy() if state[name] else None
+            try:
+                decision = ai.decide(SimpleNamespace(**state), image, map)
+            except Exception:
+                traceback.print_exc()
+                decision = None
+            conn.send((seq, decision))
+    except EOFError:
+        pass
+    finally:
+        del ring
+        shm.close()
+
+
+class ProcessAI:
+    """
+    Stands in for the AI object, running AI in a worker process.
+
+    ai_name -- name of the AI module
+    ai_config -- the AI_CONFIG setting, or None
+    config -- the AI_PROCESS setting:
+        TIMEOUT -- seconds decide waits for the worker
+        MAX_MISSES -- missed timeouts in a row after which FALLBACK is used
+        FALLBACK -- decision used while the worker is too late, stop by default
+        SLOTS -- scans held in the shared memory ring
+    """
+
+    def __init__(self, ai_name, ai_config=None, config=None):
+        config = config or {}
+        self.timeout = config.get('TIMEOUT', TIMEOUT)
+        self.max_misses = config.get('MAX_MISSES', MAX_MISSES)
+        self.fallback = config.get('FALLBACK', FALLBACK)
+        self.slots = config.get('SLOTS', SLOTS)
+
+        self.shm = shared_memory.SharedMemory(create=True, size=self.slots * len(CHANNELS) * SIZE * 8)
+        self.ring = np.ndarray((self.slots, len(CHANNELS), SIZE), dtype=np.float64,
+                               buffer=self.shm.buf)
+
+        # spawn, forking a process running the lidar reader thread is not safe
+        context = multiprocessing.get_context('spawn')
+        self.conn, worker_conn = context.Pipe()
+        self.worker = context.Process(target=serve, daemon=True,
+                                      args=(worker_conn, self.shm.name, self.slots, SIZE,
+                                            ai_name, ai_config))
+        self.worker.start()
+        worker_conn.close()
+
+        self.seq = 0
+        self.busy = False  # a scan was sent and not answered yet
+        self.alive = True
+        self.map_sent = False
+        self.decision = self.fallback
+        self.sent = 0.0
+
+        self.decisions = 0
+        self.misses = 0  # in a row
+        self.late = 0
+        self.fallbacks = 0
+        self.round_trip = Histogram()
+
+    def decide(self, bot, image, map):
+        deadline = time.monotonic() + self.timeout
+        decisions = self.decisions
+        if self.busy:
+            # the previous scan is still being decided on, its answer comes first
+            self.receive(deadline)
+        if not self.busy and self.alive:
+            self.send(bot, image, map)
+            if self.busy:
+                self.receive(deadline)
+
+        # an answer to an earlier scan still counts, it is newer than the decision in effect
+        if self.decisions == decisions:
+            self.late += 1
+            self.misses += 1
+            if self.misses > self.max_misses or not self.alive:
+                self.fallbacks += 1
+                return self.fallback
+        else:
+            self.misses = 0
+        return self.decision
+
+    def send(self, bot, image, map):
+        self.seq += 1
+        slot = self.seq % self.slots
+        length = min(len(image), SIZE)
+        self.ring[slot, 0, :length] = image[:length]
+        state = {
+            'position': getattr(bot, 'position', None),
+            'dir': getattr(bot, 'dir', None),
+            'speed': float(getattr(bot, 'speed', 0)),
+            'angle': float(getattr(bot, 'angle', 0)),
+        }
+        # the worker rebuilds these from the ring, the state only says whether they are there
+        for row, name in enumerate(CHANNELS[1:], 1):
+            values = getattr(bot, name, None)
+            state[name] = values is not None
+            if values is not None:
+                self.ring[slot, row, :length] = np.asarray(values)[:length]
+        try:
+            self.conn.send((self.seq, slot, length, state, None if self.map_sent else map))
+        except OSError:
+            print('ai worker died, using the fallback decision')
+            self.alive = False
+            return
+        self.map_sent = True
+        self.busy = True
+        self.sent = time.monotonic()
+
+    def receive(self, deadline):
+        try:
+            if not self.conn.poll(max(0.0, deadline - time.monotonic())):
+                return
+            seq, decision = self.conn.recv()
+        except (EOFError, OSError):
+            print('ai worker died, using the fallback decision')
+            self.alive = False
+            return
+
+        self.busy = False
+        self.round_trip.add(time.monotonic() - self.sent)
+        if decision is not None:
+            self.decision = decision
+            self.decisions += 1
+
+    def close(self):
+        if self.alive:
+            try:
+                self.conn.send(None)
+            except OSError:
+                pass
+        self.worker.join(1.0)
+        if self.worker.is_alive():
+            self.worker.terminate()
+        self.conn.close()
+        del self.ring
+        self.shm.close()
+        self.shm.unlink()
+
+    def stats(self):
+        return {
+            'decisions': self.decisions,
+            'late': self.late,
+            'fallbacks': self.fallbacks,
+            'round_trip': self.round_trip.snapshot(),
+        }
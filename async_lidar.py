@@ -0,0 +1,81 @@
+import asyncio
+import time
+import serial
+import ciNeuroBotLidar
+
+
+class Lidar(ciNeuroBotLidar.Lidar):
+    """
+    asyncio variant of ciNeuroBotLidar.Lidar.
+
+    Instead of a reader thread the port is read from the running event loop whenever it is
+    readable, so several lidars can share one loop. It takes the same LIDAR_CONFIG settings
+    except READ_MODE, and must be created from a coroutine.
+
+    Complete revolutions are delivered by iterating over the lidar:
+
+        async for frame in lidar:
+            ...
+
+    get_image and latest keep working from other threads.
+    """
+
+    def open(self, config):
+        com_port = config.get('PORT', "/dev/ttyUSB0")
+        baudrate = config.get('BAUDRATE', 115200)
+        self.ser = serial.Serial(com_port, baudrate, timeout=0)
+        self.loop = asyncio.get_running_loop()
+        self.scan_ready = asyncio.Event()
+
+    def start(self):
+        self.loop.add_reader(self.ser.fileno(), self.on_readable)
+
+    def on_readable(self):
+        data = self.ser.read(self.ser.in_waiting or 1)
+        self.wakeups += 1
+        seq = self.store.seq
+        self.feed(time.time(), data)
+        if self.store.seq > seq:
+            self.scan_ready.set()
+
+    def reader_cpu_time(self):
+        """
+        Returns the CPU time used by the thread running the event loop, shared by everything
+        running on it.
+        """
+        return time.thread_time()
+
+    async def next_scan(self, after_seq=0, timeout=None):
+        """
+        Waits for a revolution newer than after_seq, returns None if timeout seconds pass first.
+        """
+        deadline = None if timeout is None else self.loop.time() + timeout
+        while self.store.seq <= after_seq:
+            if self.quit:
+                return None
+            self.scan_ready.clear()
+            remaining = None if deadline is None else deadline - self.loop.time()
+            try:
+                await asyncio.wait_for(self.scan_ready.wait(), remaining)
+            except asyncio.TimeoutError:
+                return None
+        return self.store.get(after_seq)
+
+    async def __aiter__(self):
+        seq = 0
+        while not self.quit:
+            frame = await self.next_scan(seq)
+            if frame is None:
+                return
+            seq = frame.seq
+            yield frame
+
+    def stop(self):
+        """
+        Stops reading the port and ends the iteration.
+        """
+        self.quit = True
+        self.loop.remove_reader(self.ser.fileno())
+        self.ser.close()
+        self.scan_ready.set()
+        self.close()
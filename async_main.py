@@ -0,0 +1,80 @@
+"""
+    asyncio control loop
+    ====================
+
+    Same as main.py, but every lidar listed in the `LIDARS` setting is read from one event loop
+    through async_lidar. The first one drives the AI, the latest revolution of every lidar is
+    available to it as `bot.scans[name]`.
+
+    $ python3 async_main.py
+    """
+
+import asyncio
+
+import async_lidar
+from ai_process import ProcessAI
+from driver import LidarBot
+from main import setup_board, load_config, load_ai
+from watchdog import Watchdog
+
+
+async def track(name, lidar, bot):
+    async for frame in lidar:
+        bot.scans[name] = frame
+
+
+async def control(bot, lidar, watchdog):
+    loop = asyncio.get_running_loop()
+    while True:
+        frame = await lidar.next_scan(bot.last_seq, bot.scan_timeout)
+        if frame is None:
+            print('no scan')
+            bot.drive(0, 0)
+        else:
+            # decide in a worker thread so the loop keeps reading the lidars meanwhile
+            await loop.run_in_executor(None, bot.process, frame)
+
+        if watchdog.timed_out:
+            print('watchdog timed out, quitting')
+            return
+
+
+async def run():
+    config, map = load_config()
+    PBR = setup_board(config)
+    ai = load_ai(config)
+
+    lidar_configs = config.get('LIDARS', [{'NAME': 'front', 'LIDAR_CONFIG': config.get('LIDAR_CONFIG')}])
+    lidars = [(entry['NAME'], async_lidar.Lidar(entry.get('LIDAR_CONFIG'))) for entry in lidar_configs]
+
+    # setup bot driver
+    bot = LidarBot(PBR, ai, map, config, lidar=lidars[0][1])
+    bot.scans = {}
+    watchdog = Watchdog(bot.motors.off, config.get('WATCHDOG'))
+    bot.set_watchdog(watchdog)
+    trackers = [asyncio.ensure_future(track(name, lidar, bot)) for name, lidar in lidars]
+
+    # drive!
+    try:
+        await control(bot, bot.lidar, watchdog)
+    finally:
+        # cleanup
+        watchdog.stop()
+        for name, lidar in lidars:
+            lidar.stop()
+        await asyncio.gather(*trackers, return_exceptions=True)
+
+        if isinstance(ai, ProcessAI):
+            ai.close()
+
+        # kill motors
+        bot.motors.stop()
+
+        print('exiting.')
+
+
+if __name__ == '__main__':
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        print('shutting down.')
@@ -0,0 +1,53 @@
+"""
+    Raw lidar stream capture files
+    ==============================
+
+    A capture file starts with the magic bytes `NEATOCAP`, followed by one record per serial read:
+
+    <arrival time> <length> [data]
+
+    where <arrival time> is a little-endian double holding `time.time()` when the read returned,
+    <length> is a little-endian 32 bit unsigned int and [data] the <length> bytes exactly as they
+    were read from the port.
+    """
+
+import struct
+
+MAGIC = b'NEATOCAP'
+RECORD = struct.Struct('<dI')
+
+
+class CaptureWriter:
+
+    def __init__(self, path):
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC)
+
+    def write(self, stamp, data):
+        """
+        Appends one read to the capture.
+        """
+        self.file.write(RECORD.pack(stamp, len(data)))
+        self.file.write(data)
+
+    def close(self):
+        self.file.close()
+
+
+def read_capture(path):
+    """
+    Yields the (arrival time, data) records of a capture file in order.
+    """
+    with open(path, 'rb') as capture_file:
+        if capture_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a lidar capture'.format(path))
+
+        while True:
+            header = capture_file.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            stamp, length = RECORD.unpack(header)
+            data = capture_file.read(length)
+            if len(data) < length:
+                return
+            yield stamp, data
@@ -51,34 +51,203 @@
 
 import threading
 import time
-import sys
-import traceback
-import math
-import codecs
+import select
 import serial
+import numpy as np
+from scan import ScanStore, FLAG_INVALID, FLAG_WEAK
+from capture import CaptureWriter
+from lidar_stats import LidarStats, STATS_INTERVAL
+
+PACKET_LEN = 22
+START_BYTE = 0xFA
+INDEX_MIN = 0xA0
+INDEX_MAX = 0xF9
+
+# packets per blocking read, about 19ms of data at 115200 baud
+READ_PACKETS = 10
+# seconds a select read waits before checking whether the reader should quit
+SELECT_TIMEOUT = 0.1
+
+READING_DTYPE = np.dtype([('distance', '<u2'), ('strength', '<u2')])
+PACKET_DTYPE = np.dtype([
+    ('start', 'u1'),
+    ('index', 'u1'),
+    ('speed', '<u2'),
+    ('data', READING_DTYPE, (4,)),
+    ('checksum', '<u2'),
+])
+
+PACKET_OFFSETS = np.arange(PACKET_LEN)
+CHECKSUM_SHIFTS = np.arange(9, -1, -1, dtype=np.uint32)
+READING_OFFSETS = np.arange(4)
+
+
+def checksums(raw):
+    """
+    Vectorized version of Lidar.checksum.
+
+    raw -- uint8 array of shape (N, 22) holding whole packets.
+    """
+    words = raw[:, :20].astype(np.uint32)
+    # group the data by word, little-endian
+    words = words[:, 0::2] | (words[:, 1::2] << 8)
+    # chk32 = (chk32 << 1) + d for every word is the same as weighting word t by 2 ** (9 - t)
+    chk32 = (words << CHECKSUM_SHIFTS).sum(axis=1)
+    return ((chk32 & 0x7FFF) + (chk32 >> 15)) & 0x7FFF
+
+
+def decode_packets(buf):
+    """
+    Decode every complete packet in a chunk of the raw stream.
+
+    buf -- bytes-like object, may start and end in the middle of a packet.
+
+    Returns (packets, offsets, consumed, nb_errors): an array of PACKET_DTYPE, the offset of every
+    packet in buf, the number of leading bytes of buf that will never be part of a packet, and the
+    number of sync points with a bad checksum.
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    last = len(data) - PACKET_LEN
+    if last < 0:
+        return np.empty(0, PACKET_DTYPE), np.empty(0, np.intp), 0, 0
+
+    # sync points are a start byte followed by a valid index byte
+    starts = np.flatnonzero(data[:last + 1] == START_BYTE)
+    index = data[starts + 1]
+    starts = starts[(index >= INDEX_MIN) & (index <= INDEX_MAX)]
+
+    raw = data[starts[:, None] + PACKET_OFFSETS]
+    incoming = raw[:, 20] | (raw[:, 21].astype(np.uint32) << 8)
+    good = checksums(raw) == incoming
+
+    accepted = starts[good]
+    if np.any(np.diff(accepted) < PACKET_LEN):
+        # a checksum can match by accident inside a real packet, keep the first of each overlap
+        keep = np.zeros(len(accepted), dtype=bool)
+        end = -1
+        for i, start in enumerate(accepted):
+            if start >= end:
+                keep[i] = True
+                end = start + PACKET_LEN
+        good[np.flatnonzero(good)[~keep]] = False
+        accepted = accepted[keep]
+
+    # bad sync points lying inside an accepted packet are just payload bytes
+    rejected = starts[~good]
+    if len(accepted) > 0 and len(rejected) > 0:
+        pos = np.searchsorted(accepted, rejected, side='right') - 1
+        inside = (pos >= 0) & (rejected < accepted[np.maximum(pos, 0)] + PACKET_LEN)
+        rejected = rejected[~inside]
+
+    consumed = last + 1
+    if len(accepted) > 0:
+        consumed = max(consumed, int(accepted[-1]) + PACKET_LEN)
+
+    packets = raw[good].view(PACKET_DTYPE).reshape(-1)
+    return packets, accepted, consumed, len(rejected)
+
+
+def unpack_readings(packets):
+    """
+    Unpack the 4 readings of every packet.
+
+    Returns (angles, distances, qualities, flags) as flat arrays of 4 * len(packets) elements.
+    Invalid readings get a distance and quality of 0, weak readings a quality of 0.
+    """
+    angles = (((packets['index'].astype(np.intp) - INDEX_MIN) * 4)[:, None] + READING_OFFSETS).ravel()
+    raw_dist = packets['data']['distance'].ravel()
+
+    flags = ((raw_dist >> 8) & (FLAG_INVALID | FLAG_WEAK)).astype(np.uint8)
+    dist_mm = (raw_dist & 0x3FFF).astype(np.int32)  # remove the flags
+    quality = packets['data']['strength'].ravel().astype(np.int32)
+
+    dist_calc_error = (flags & FLAG_INVALID) > 0
+    dist_mm[dist_calc_error] = 0
+    quality[dist_calc_error | ((flags & FLAG_WEAK) > 0)] = 0
+
+    return angles, dist_mm, quality, flags
+
+
+def reading_stamps(packets, packet_stamps):
+    """
+    Spreads the time of every packet over its 4 readings, one degree of rotation apart.
+
+    packet_stamps -- arrival time of the last byte of every packet
+
+    Returns (stamps, rpms) as flat arrays like unpack_readings.
+    """
+    rpm = packets['speed'] / 64.0  # little-endian fixed point, 6 decimal bits
+    degree_time = np.zeros(len(rpm))
+    np.divide(60.0 / 360, rpm, out=degree_time, where=rpm > 0)
+    stamps = packet_stamps[:, None] - (3 - READING_OFFSETS) * degree_time[:, None]
+    return stamps.ravel(), np.repeat(rpm, 4)
+
 
 class Lidar:
     
-    def __init__(self):
+    def __init__(self, config=None):
+        """
+        config -- optional dict, the LIDAR_CONFIG setting:
+            PORT -- serial port of the lidar
+            BAUDRATE -- baud rate of the serial port
+            READ_MODE -- 'timeout' blocks on reads of READ_PACKETS packets using the serial timeout,
+                         'select' waits on the port with select and reads whatever arrived
+            READ_PACKETS -- packets per read in 'timeout' mode
+            CAPTURE -- path of a capture file recording the raw byte stream, see capture.py
+            STATS_FILE -- path of a file the health counters are appended to every STATS_INTERVAL
+            STATS_INTERVAL -- seconds between two rate measurements
+        """
+        config = config or {}
+
+        self.health = LidarStats(interval=config.get('STATS_INTERVAL', STATS_INTERVAL),
+                                 path=config.get('STATS_FILE'))
+        self.wakeups = 0
+        self.started = time.time()
+        self.byte_time = 10.0 / config.get('BAUDRATE', 115200)  # 8N1, 10 bits per byte
+        
+        self.store = ScanStore()  # revolutions of 360 [distance, quality] samples
+        self.capture = None
+        if 'CAPTURE' in config:
+            self.capture = CaptureWriter(config['CAPTURE'])
+
+        self.buf = b''
+        self.quit = False
+        self.watchdog = None  # beaten for every chunk with packets in it
+        self.read_thread = None
+        self.open(config)
+        self.start()
+
+    def start(self):
+        """
+        Starts the reader thread.
+        """
+        self.read_thread = threading.Thread(target=self.readLidar)
+        self.read_thread.start()
+
+    def open(self, config):
+        """
+        Opens the serial port and picks the read method for READ_MODE.
+        """
         # for Linux it would be something like the following depending on which port USB is connected to:
-        com_port = "/dev/ttyUSB0"
+        com_port = config.get('PORT', "/dev/ttyUSB0")
         # try the command "ls /dev/tty*" to see what's available
         # for Mac OS X, use:
         # com_port = "/dev/cu.usbserial"
-        baudrate = 115200
-        
-        self.init_level = 0
-        self.index = 0
+        baudrate = config.get('BAUDRATE', 115200)
         
-        self.lidarData = [[] for i in range(360)]  # A list of 360 elements Angle, Distance , quality
-        self.lidarBuffer = [[] for i in range(360)] #A buffer for LIDAR data to copy to and read from
-        self.dataLock = threading.Lock()
-        self.bufferLock = threading.Lock()
-        self.ser = serial.Serial(com_port, baudrate)
-        self.buffer_filled = threading.Condition(self.bufferLock)
-        self.quit = False
-        self.read_thread = threading.Thread(target=self.readLidar)
-        self.read_thread.start()
+        self.read_mode = config.get('READ_MODE', 'timeout')
+        self.read_size = config.get('READ_PACKETS', READ_PACKETS) * PACKET_LEN
+        if self.read_mode == 'timeout':
+            # long enough for a full read at the port speed (10 bits per byte), with some margin
+            read_timeout = 2 * self.read_size * 10.0 / baudrate
+            self.read_chunk = self.read_blocking
+        elif self.read_mode == 'select':
+            read_timeout = 0
+            self.read_chunk = self.read_select
+        else:
+            raise ValueError('unknown READ_MODE {}'.format(self.read_mode))
+
+        self.ser = serial.Serial(com_port, baudrate, timeout=read_timeout)
 
     def checksum(self, data):
         """
@@ -103,202 +272,115 @@ class Lidar:
         checksum = checksum & 0x7FFF  # truncate to 15 bits
         return int(checksum)
 
+    def read_blocking(self):
+        """
+        Blocks until READ_PACKETS packets arrived or the serial timeout ran out.
 
-    def readLidar(self):
+        Returns the arrival time and the bytes read, like every read method.
+        """
+        data = self.ser.read(max(self.read_size, self.ser.in_waiting))
+        return time.time(), data
 
-        nb_errors = 0
+    def read_select(self):
+        """
+        Blocks on the port until data arrives and returns all of it.
+        """
+        ready, _, _ = select.select([self.ser.fileno()], [], [], SELECT_TIMEOUT)
+        if not ready:
+            return time.time(), b''
+        data = self.ser.read(self.ser.in_waiting)
+        return time.time(), data
+
+    def readLidar(self):
         while not self.quit:
-            # try:
-            time.sleep(0.00001)  # do not hog the processor power
-            
-            if self.init_level == 0:
-                b_start = self.ser.read(1)
-                #print("b_start = {0}".format(b_start))
-                b = int.from_bytes(b_start, 'big')
-                # start byte
-                if b == 0xFA:
-                    self.init_level = 1
-                    #print("got start\n")
-                else:
-                    self.init_level = 0
-            elif self.init_level == 1:
-                # position index
-                b_index = self.ser.read(1)
-                #print("b_index = {0}".format(b_index))
-                b = int.from_bytes(b_index, 'big')
-                if b >= 0xA0 and b <= 0xF9:
-                    self.index = b - 0xA0
-                    self.init_level = 2
-                    #print("got packet #{0:02x}\n".format(self.index))
-                    
-                    
-                elif b != 0xFA:
-                    self.init_level = 0
-            elif self.init_level == 2:
-                # speed
-                # b_speed = [ b for b in ser.read(2)]
-                b_speed = self.ser.read(2)
-                
-                # data
-                # b_data0 = [ b for b in ser.read(4)]
-                # b_data1 = [ b for b in ser.read(4)]
-                # b_data2 = [ b for b in ser.read(4)]
-                # b_data3 = [ b for b in ser.read(4)]
-                b_data0 = self.ser.read(4)
-                b_data1 = self.ser.read(4)
-                b_data2 = self.ser.read(4)
-                b_data3 = self.ser.read(4)
-                
-                #print("data\n")
-                #print("data0 = {0}".format(b_data0))
-                #print("data1 = {0}".format(b_data1))
-                #print("data2 = {0}".format(b_data2))
-                #print("data3 = {0}".format(b_data3))
-                
-                # we need all the data of the packet to verify the checksum
-                all_data = b_start + b_index + b_speed + b_data0 + b_data1 + b_data2 + b_data3
-                #print("all_data = {0}".format(all_data))
-                
-                # checksum
-                b_checksum = self.ser.read(2)
-                #print("checksum bytes: {0}".format(b_checksum))
-                # incoming_checksum = int(b_checksum[0]) + (int(b_checksum[1]) << 8)
-                incoming_checksum = int.from_bytes(b_checksum, 'little')
-                #print("incoming_checksum = {0}".format(incoming_checksum))
-                
-                # verify that the received checksum is equal to the one computed from the data
-                calculated_checksum = self.checksum(all_data)
-                #print("calculated_checksum = {0}".format(calculated_checksum))
-                if self.checksum(all_data) == incoming_checksum:
-                    speed_rpm = float(int.from_bytes(b_speed, 'big')) / 64.0
-                    #print("speed = {0}".format(speed_rpm))
-                    # if visualization:
-                    #     gui_update_speed(speed_rpm)
-                    
-                    self.dataLock.acquire()
-                    self.update_view(self.index * 4 + 0, b_data0)
-                    self.update_view(self.index * 4 + 1, b_data1)
-                    self.update_view(self.index * 4 + 2, b_data2)
-                    self.update_view(self.index * 4 + 3, b_data3)
-                    self.dataLock.release()
-                    
-                    self.lidarBuffer[self.index * 4 + 0] = self.lidarData[self.index * 4 + 0]
-                    self.lidarBuffer[self.index * 4 + 1] = self.lidarData[self.index * 4 + 1]
-                    self.lidarBuffer[self.index * 4 + 2] = self.lidarData[self.index * 4 + 2]
-                    self.lidarBuffer[self.index * 4 + 3] = self.lidarData[self.index * 4 + 3]
-                    
-                    if (self.index * 4 + 3) == 359:
-                        with self.buffer_filled:
-                            self.buffer_filled.notify()
-                    
-                else:
-                    # the checksum does not match, something went wrong...
-                    nb_errors += 1
-                    #print("wrong checksum nb_errors={0}\n".format(nb_errors))
-                # if visualization:
-                #     label_errors.text = "errors: "+str(nb_errors)
-                
-                # display the samples in an error state
-                # update_view(index * 4 + 0, [0, 0x80, 0, 0])
-                # update_view(index * 4 + 1, [0, 0x80, 0, 0])
-                # update_view(index * 4 + 2, [0, 0x80, 0, 0])
-                # update_view(index * 4 + 3, [0, 0x80, 0, 0])
-                
-                self.init_level = 0  # reset and wait for the next packet
-                #print(self.index)
-                #print(self.lidarData)
-            # return # to test
-
-            else:  # default, should never happen...
-                self.init_level = 0
-    # except :
-    #     traceback.print_exc(file=sys.stdout)
-    #     return
-
-    def update_view(self, angle, data):
+            stamp, data = self.read_chunk()
+            self.wakeups += 1
+            self.feed(stamp, data)
+
+        self.close()
+
+    def feed(self, stamp, data):
         """
-        Updates the view of a sample.
-        
-        Takes the angle (an int, from 0 to 359) and the list of four bytes of data in the order they arrived.
+        Decodes a chunk of the raw stream and stores its samples.
+
+        stamp -- arrival time of the last byte of data
         """
-        # global offset, use_outer_line, use_line
-        # unpack data using the denomination used during the discussions
-        # x0 = data[0]
-        # x1 = data[1]
-        # x2 = data[2]
-        # x3 = data[3]
-        
-        angle_rad = angle * math.pi / 180.0
-        c = math.cos(angle_rad)
-        s = -math.sin(angle_rad)
-        
-        dist_mm = data[0] | ((data[1] & 0x3f) << 8)  # remove the flags
-        quality = data[2] | (data[3] << 8)  # quality is on 16 bits
-        
-        dist_calc_error = (data[1] & 0x80) > 0  # check bit 7 flag
-        if dist_calc_error:
-            dist_mm = 0
-            quality = 0
-            #print("distance calculation error: {0}\n".format(data[0]))  # error code in data[0]
-        
-        inferior_signal = (data[1] & 0x40) > 0  # check bit 6 flag
-        if inferior_signal:
-            quality = 0
-            #print("inferior signal\n")
-        
-        #quality = int.from_bytes(data[2:4], 'big')
-        
-        self.lidarData[angle] = [dist_mm, quality]
-        dist_x = dist_mm*c
-        dist_y = dist_mm*s
-    #     if visualization:
-    #         #reset the point display
-    #         point.pos[angle] = vector( 0, 0, 0 )
-    #         pointb.pos[angle] = vector( 0, 0, 0 )
-    #         point2.pos[angle] = vector( 0, 0, 0 )
-    #         point2b.pos[angle] = vector( 0, 0, 0 )
-    #         if not use_lines : lines[angle].pos[1]=(offset*c,0,offset*s)
-    #         if not use_outer_line :
-    #             outer_line.pos[angle]=(offset*c,0,offset*s)
-    #             outer_line.color[angle] = (0.1, 0.1, 0.2)
-
-
-    #         # display the sample
-    #         if x1 & 0x80: # is the flag for "bad data" set?
-    #             # yes it's bad data
-    #             lines[angle].pos[1]=(offset*c,0,offset*s)
-    #             outer_line.pos[angle]=(offset*c,0,offset*s)
-    #             outer_line.color[angle] = (0.1, 0.1, 0.2)
-    #         else:
-    #             # no, it's cool
-    #             if not x1 & 0x40:
-    #                 # X+1:6 not set : quality is OK
-    #                 if use_points : point.pos[angle] = vector( dist_x,0, dist_y)
-    #                 if use_intensity : point2.pos[angle] = vector( (quality + offset)*c,0,
-    #                       (quality + offset)*s)
-    #                 if use_lines : lines[angle].color[1] = (1,0,0)
-    #                 if use_outer_line : outer_line.color[angle] = (1,0,0)
-    #             else:
-    #                 # X+1:6 set : Warning, the quality is not as good as expected
-    #                 if use_points : pointb.pos[angle] = vector( dist_x,0, dist_y)
-    #                 if use_intensity : point2b.pos[angle] = vector( (quality + offset)*c,0,
-    #                       (quality + offset)*s)
-    #                 if use_lines : lines[angle].color[1] = (0.4,0,0)
-    #                 if use_outer_line : outer_line.color[angle] = (0.4,0,0)
-    #             if use_lines : lines[angle].pos[1]=( dist_x, 0, dist_y)
-    #             if use_outer_line : outer_line.pos[angle]=( dist_x, 0, dist_y)
-
-    def get_image(self):
+        if self.capture is not None and data:
+            self.capture.write(stamp, data)
+        buf = self.buf + data
+        decode_start = time.perf_counter()
+
+        packets, offsets, consumed, nb_errors = decode_packets(buf)
+        # the last byte of buf arrived at stamp, earlier bytes one byte time apart
+        packet_stamps = stamp - (len(buf) - offsets - PACKET_LEN) * self.byte_time
+        self.buf = buf[consumed:]
+        if len(packets) == 0:
+            self.health.nb_errors += nb_errors
+            self.health.tick(self.store.seq)
+            return
+
+        angles, dists, quals, flags = unpack_readings(packets)
+        stamps, rpms = reading_stamps(packets, packet_stamps)
+        self.store.write(angles, dists, quals, flags, stamps, rpms)
+        if self.watchdog is not None:
+            self.watchdog.beat('lidar')
+
+        self.health.record(len(packets), nb_errors, angles, flags, rpms,
+                           time.perf_counter() - decode_start)
+        self.health.tick(self.store.seq)
+
+    def close(self):
         """
-        Returns the current lidar buffer
+        Closes the capture and stats files once reading stopped.
         """
-        lidarOut = []
-        
-        with self.buffer_filled:
-            while (self.index * 4 + 3) < 359:
-                self.buffer_filled.wait()
-            
-            lidarOut = self.lidarBuffer
-        
-        return lidarOut
+        if self.capture is not None:
+            self.capture.close()
+        self.health.close()
 
+    @property
+    def nb_errors(self):
+        return self.health.nb_errors
+
+    def reader_cpu_time(self):
+        """
+        Returns the CPU time in seconds used by the reader thread so far.
+        """
+        if self.read_thread is None or not self.read_thread.is_alive():
+            return 0.0
+        clock = time.pthread_getcpuclockid(self.read_thread.ident)
+        return time.clock_gettime(clock)
+
+    def get_image(self, after_seq=None, timeout=None):
+        """
+        Returns the latest complete revolution as a ScanFrame.
+
+        after_seq -- sequence number of the last revolution the caller has seen, only a newer one is
+                     returned.
+        timeout -- seconds to wait for a revolution, None is returned when it runs out.
+
+        Raises scan.EndOfScans once the lidar ran out of revolutions, like a replay at its end.
+        """
+        return self.store.get(after_seq, timeout)
+
+    def latest(self):
+        """
+        Returns the latest complete revolution without waiting, None until the first one.
+        """
+        return self.store.latest()
+
+    def stats(self):
+        """
+        Returns the health and throughput counters of the reader and how revolutions were consumed.
+        """
+        elapsed = time.time() - self.started
+        cpu_time = self.reader_cpu_time()
+        stats = self.health.snapshot()
+        stats.update({
+            'reader_cpu_time': cpu_time,
+            'reader_cpu_percent': 100.0 * cpu_time / elapsed,
+            'wakeups_per_s': self.wakeups / elapsed,
+            'seq': self.store.seq,
+            'dropped': self.store.dropped,
+            'overwritten': self.store.overwritten,
+        })
+        return stats
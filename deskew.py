@@ -0,0 +1,51 @@
+import numpy as np
+from raycast import FORWARD_INDEX
+
+
+def deskew(frame, speed, turn_rate, ref=None):
+    """
+    Corrects a revolution for the motion of the bot while it was captured.
+
+    Every sample is moved to where it would have been seen from the pose of the bot at the
+    reference time, assuming constant speed and turn rate over the revolution.
+
+    frame -- ScanFrame with per-sample stamps
+    speed -- forward speed in mm/s
+    turn_rate -- counterclockwise turn rate in radians/s
+    ref -- reference time, the end of the revolution by default
+
+    Returns a new image of [distance, quality] rows. Samples landing on the same angle keep the
+    closest one, angles nothing lands on are left at 0 like invalid samples.
+    """
+    image = np.asarray(frame)
+    size = len(image)
+    if ref is None:
+        ref = frame.stamp
+
+    index = np.flatnonzero((image[:, 0] > 0) & (frame.stamps > 0))
+    dists = image[index, 0].astype(np.float64)
+
+    # pose of the bot at the sample time, relative to the pose at the reference time
+    elapsed = ref - frame.stamps[index]
+    theta = -turn_rate * elapsed
+    travel = -speed * elapsed
+    pose_x = travel * np.cos(theta / 2)
+    pose_y = travel * np.sin(theta / 2)
+
+    # sample angles are counterclockwise from the front of the bot
+    phi = np.radians((FORWARD_INDEX - index) * 360.0 / size) + theta
+    x = pose_x + dists * np.cos(phi)
+    y = pose_y + dists * np.sin(phi)
+
+    dists = np.hypot(x, y)
+    angles = np.rint(FORWARD_INDEX - np.degrees(np.arctan2(y, x)) * size / 360.0).astype(np.intp) % size
+
+    # keep the closest sample of every angle
+    order = np.lexsort((dists, angles))
+    angles, first = np.unique(angles[order], return_index=True)
+    keep = order[first]
+
+    out = np.zeros_like(image)
+    out[angles, 0] = np.rint(dists[keep])
+    out[angles, 1] = image[index[keep], 1]
+    return out
@@ -1,50 +1,207 @@
+import time
 import numpy as np
+from deskew import deskew
+from telemetry import Telemetry
+from motors import MotorCommander
+from localization import Localizer
+from occupancy import OccupancyGrid, live_map
+from planner import Planner
+from scan_filter import ScanFilter
+import raycast
+
+# seconds to wait for a revolution before stopping the motors
+SCAN_TIMEOUT = 0.5
 
 class PiBorgBot:
-    def __init__(self, PBR):
+    def __init__(self, PBR, config=None):
         self.PBR = PBR
+        self.motors = MotorCommander(PBR, (config or {}).get('MOTORS'))
+        self.left = 0
+        self.right = 0
 
     def drive(self, left, right):
-        self.PBR.SetMotor1(left)
-        self.PBR.SetMotor2(-right)
+        self.left = left
+        self.right = right
+        self.motors.set(left, -right)
 
 
 class LidarBot(PiBorgBot):
-    def __init__(self, PBR, ai, map, config):
-        super().__init__(PBR)
+    def __init__(self, PBR, ai, map, config, lidar=None):
+        super().__init__(PBR, config)
         self.ai = ai
         self.map = map
         self.position = config['START_POS']
         self.dir = config['START_DIR']
-        self.lidar = __import__(config['LIDAR_MODULE']).Lidar()
+        if lidar is None:
+            lidar = __import__(config['LIDAR_MODULE']).Lidar(config.get('LIDAR_CONFIG'))
+        self.lidar = lidar
+        self.scan_timeout = config.get('SCAN_TIMEOUT', SCAN_TIMEOUT)
+        self.last_seq = 0
+        self.last_scan = time.time()
+
+        self.qualities = None
+
+        # smooths revolutions and fills invalid readings before the AI sees them
+        self.scan_filter = None
+        self.confidence = None
+        if 'SCAN_FILTER' in config:
+            self.scan_filter = ScanFilter(config['SCAN_FILTER'])
+
+        # last decision, for AIs looking at the motion of the bot
+        self.speed = 0
+        self.angle = 0
+        self.deskew = config.get('DESKEW')
+
+        self.localizer = None
+        if 'LOCALIZATION' in config:
+            localization_config = dict(config['LOCALIZATION'])
+            localization_config.setdefault('CACHE_DIR', config.get('CACHE_DIR'))
+            self.localizer = Localizer(map, self.position, self.dir, localization_config)
+        self.last_stamp = None
+
+        # live map of what the lidar sees, handed to the AI as map.grid
+        self.grid = None
+        if 'OCCUPANCY' in config:
+            self.grid = OccupancyGrid(config['OCCUPANCY'])
+
+        # path to the goal, handed to the AI as map.planner
+        self.planner = None
+        if 'PLANNER' in config:
+            planner_config = dict(config['PLANNER'])
+            planner_config.setdefault('CACHE_DIR', config.get('CACHE_DIR'))
+            self.planner = Planner(map, planner_config)
+
+        if self.grid is not None or self.planner is not None:
+            self.map = live_map(map, self.grid, self.planner)
+
+        self.watchdog = None
+        self.telemetry = None
+        if 'TELEMETRY' in config:
+            self.telemetry = Telemetry(config['TELEMETRY'])
+        self.scan_wait = 0.0
+
+    def set_watchdog(self, watchdog):
+        """
+        Makes the lidar, the motors and the bot beat the heartbeats of watchdog.
+        """
+        self.watchdog = watchdog
+        self.lidar.watchdog = watchdog
+        self.motors.watchdog = watchdog
 
     def update(self):
-        image = self.lidar.get_image()
+        wait_start = time.perf_counter()
+        frame = self.lidar.get_image(after_seq=self.last_seq, timeout=self.scan_timeout)
+        self.scan_wait = time.perf_counter() - wait_start
+        if frame is None:
+            print('no scan')
+            self.drive(0, 0)
+            return
+        self.process(frame)
+
+    def poll(self):
+        """
+        Processes the latest revolution if it was not processed yet, without waiting for one.
+
+        Stops the motors once no new revolution arrived for SCAN_TIMEOUT.
+        """
+        frame = self.lidar.latest()
+        if frame is None or frame.seq == self.last_seq:
+            if time.time() - self.last_scan > self.scan_timeout and (self.left, self.right) != (0, 0):
+                print('no scan')
+                self.drive(0, 0)
+            return
+        self.last_scan = time.time()
+        self.scan_wait = 0.0
+        self.process(frame)
+
+    def motor_tick(self):
+        """
+        Moves the motors on towards the last command between revolutions.
+        """
+        self.motors.apply()
+
+    def process(self, frame):
+        """
+        Lets the AI decide on a revolution and drives accordingly.
+        """
+        self.last_seq = frame.seq
+        if self.watchdog is not None:
+            self.watchdog.beat('scan')
+
+        image = frame.image
+        if self.deskew is not None:
+            # motion of the motor values in effect, the same kinematics as the simulator and
+            # Localizer.predict, so clipping and mixing in arcade are accounted for
+            speed = (self.left + self.right) / 2 * self.deskew['MAX_SPEED']
+            turn_rate = (self.left - self.right) / 2 * self.deskew['MAX_TURN_RATE']
+            image = deskew(frame, speed, turn_rate)
 
         try:
-            distances = [d[0] for d in image]
+            distances = image[:, 0]
         except IndexError: 
             print('bad data')
             self.drive(0, 0)
             return
 
+        # signal strengths, for AIs that weigh readings by them
+        self.qualities = image[:, 1]
+
+        if self.localizer is not None:
+            self.localize(frame, distances)
+        if self.grid is not None:
+            self.grid.update(self.position, raycast.heading(self.dir), distances)
+            if self.planner is not None:
+                self.planner.replan(self.grid, self.position)
+
+        if self.scan_filter is not None:
+            # the history only turns with the bot when its heading is tracked
+            heading = raycast.heading(self.dir) if self.localizer is not None else None
+            distances = self.scan_filter.update(distances, self.qualities, heading)
+            self.confidence = self.scan_filter.confidence
+
+        if self.watchdog is not None:
+            self.watchdog.beat('ai')
+        decide_start = time.perf_counter()
         decision = self.ai.decide(self, distances, self.map)
-        print(repr(decision))
+        decide_time = time.perf_counter() - decide_start
+        if self.watchdog is not None:
+            self.watchdog.done('ai')
 
         speed = decision['speed']
         angle = decision['angle']
         speed = np.clip(speed, -1, 1)
         angle = np.clip(angle, -1, 1)
+        self.speed = speed
+        self.angle = angle
 
         left, right = arcade(speed, angle)
 
         left = np.clip(left, -1, 1)
         right = np.clip(right, -1, 1)
+        drive_start = time.perf_counter()
         self.drive(left, right)
-        print('left: {}, right: {}'.format(left, right))
+        drive_time = time.perf_counter() - drive_start
+
+        if self.telemetry is not None:
+            self.telemetry.record(frame.seq, speed, angle, left, right,
+                                  self.scan_wait, decide_time, drive_time)
+
+    def localize(self, frame, distances):
+        """
+        Moves the pose estimate with the motor values in effect since the last revolution and
+        corrects it with this one.
+        """
+        if self.last_stamp is not None:
+            self.localizer.predict(self.left, self.right, frame.stamp - self.last_stamp)
+        self.last_stamp = frame.stamp
+        self.localizer.update(distances)
+        self.position, self.dir = self.localizer.estimate()
 
     def stop(self):
         self.lidar.quit = True
+        self.motors.stop()
+        if self.telemetry is not None:
+            self.telemetry.stop()
 
 def arcade(speed, angle):
     # http://robotpy.readthedocs.io/en/latest/wpilib/RobotDrive.html#wpilib.robotdrive.RobotDrive.arcadeDrive
@@ -63,3 +220,20 @@ def arcade(speed, angle):
             left = speed - angle
             right = -max(-speed, -angle)
     return left, right
+
+
+def arcade_batch(speeds, angles):
+    """
+    Vectorized arcade over arrays of speeds and angles, returns arrays of left and right.
+    """
+    speeds = np.asarray(speeds, dtype=float)
+    angles = np.asarray(angles, dtype=float)
+    forward = speeds > 0
+    clockwise = angles > 0.0
+    left = np.where(forward,
+                    np.where(clockwise, speeds - angles, np.maximum(speeds, -angles)),
+                    np.where(clockwise, -np.maximum(-speeds, angles), speeds - angles))
+    right = np.where(forward,
+                     np.where(clockwise, np.maximum(speeds, angles), speeds + angles),
+                     np.where(clockwise, speeds + angles, -np.maximum(-speeds, -angles)))
+    return left, right
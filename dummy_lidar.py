@@ -1,5 +1,16 @@
+import time
+import numpy as np
+from scan import ScanFrame
+
 class Lidar:
-    def get_image(self):
+    def __init__(self, config=None):
+        self.seq = 0
+
+    def get_image(self, after_seq=None, timeout=None):
+        return self.latest()
+
+    def latest(self):
+        self.seq += 1
         dists = [
             242.36631468, 242.51570184, 242.7392596, 243.03732975, 243.41036913,
             243.85895142, 244.38376927, 244.98563689, 245.66549322, 246.42440553,
@@ -77,4 +88,8 @@ class Lidar:
         
         qualities = [1] * len(dists)
         
-        return [[d, q] for d, q in zip(dists, qualities)]
+        image = np.array([[d, q] for d, q in zip(dists, qualities)])
+        return ScanFrame(image, self.seq, time.time())
+
+    def stats(self):
+        return {'seq': self.seq, 'dropped': 0, 'overwritten': 0}
@@ -0,0 +1,178 @@
+"""
+    Synthetic Neato lidar on a pseudo-terminal
+    ==========================================
+
+    Ray casts a map.json world from a fixed pose and streams the result as Neato v2.4/v2.6 packets
+    (see ciNeuroBotLidar) to a pty, so ciNeuroBotLidar can read it by setting `PORT` in
+    `LIDAR_CONFIG` to the printed device.
+
+    $ python3 fake_neato.py --rpm 600 --noise 5 --corrupt 0.01
+    """
+
+import argparse
+import json
+import os
+import threading
+import time
+import tty
+import numpy as np
+
+import raycast
+from ciNeuroBotLidar import PACKET_DTYPE, PACKET_LEN, INDEX_MIN, checksums
+from scan import FLAG_INVALID, FLAG_WEAK
+
+MIN_RANGE = 150  # mm
+MAX_RANGE = 6000  # mm
+ERROR_CODE = 0x02  # sent in byte 0 of invalid readings
+
+
+def encode_revolution(dists, quals, flags, rpm):
+    """
+    Encodes one revolution as 90 packets.
+
+    dists -- 360 distances in mm
+    quals -- 360 signal strengths
+    flags -- 360 flag bytes, FLAG_INVALID and/or FLAG_WEAK
+
+    Returns the packets as an array of PACKET_DTYPE.
+    """
+    packets = np.zeros(90, dtype=PACKET_DTYPE)
+    packets['start'] = 0xFA
+    packets['index'] = INDEX_MIN + np.arange(90)
+    packets['speed'] = min(int(round(rpm * 64)), 0xFFFF)  # fixed point, 6 decimal bits
+
+    dists = np.clip(np.asarray(dists), 0, 0x3FFF).astype(np.uint16)
+    quals = np.clip(np.asarray(quals), 0, 0xFFFF).astype(np.uint16)
+    flags = np.asarray(flags, dtype=np.uint16)
+    invalid = (flags & FLAG_INVALID) > 0
+
+    # invalid readings are sent as `YY 80 00 00`
+    dists = np.where(invalid, ERROR_CODE, dists)
+    quals = np.where(invalid, 0, quals)
+    packets['data']['distance'] = (dists | (flags << 8)).reshape(90, 4)
+    packets['data']['strength'] = quals.reshape(90, 4)
+
+    raw = packets.view(np.uint8).reshape(90, PACKET_LEN)
+    packets['checksum'] = checksums(raw)
+    return packets
+
+
+class FakeNeato:
+    """
+    Streams ray cast revolutions to a pty at a fixed rotation speed.
+
+    noise -- standard deviation of the distance noise in mm
+    weak -- fraction of readings flagged with a strength warning
+    corrupt -- fraction of packets with a flipped byte, which fail their checksum
+    scale -- mm per map unit
+    """
+
+    def __init__(self, map, position, direction, rpm=300, noise=0.0, weak=0.0, corrupt=0.0,
+                 scale=20.0, seed=None):
+        self.segments = raycast.load_segments(map) * scale
+        self.position = np.asarray(position, dtype=np.float64) * scale
+        self.theta = raycast.heading(direction)
+        self.rpm = rpm
+        self.noise = noise
+        self.weak = weak
+        self.corrupt = corrupt
+        self.random = np.random.default_rng(seed)
+
+        self.master, self.slave = os.openpty()
+        tty.setraw(self.slave)
+        # a real sensor keeps spinning whether anyone reads it or not
+        os.set_blocking(self.master, False)
+        self.port = os.ttyname(self.slave)
+
+        self.revolutions = 0
+        self.quit = False
+        self.thread = threading.Thread(target=self.run)
+
+    def revolution(self):
+        """
+        Returns the bytes of the next revolution.
+        """
+        angles = raycast.beam_angles(self.theta)
+        dists = raycast.cast(self.segments, self.position, angles, MAX_RANGE + 1)
+        if self.noise > 0:
+            dists = dists + self.random.normal(0, self.noise, dists.shape)
+
+        # strength falls off with the square of the distance
+        quals = 2e8 / np.maximum(dists, MIN_RANGE) ** 2
+        flags = np.zeros(360, dtype=np.uint16)
+        flags[(dists < MIN_RANGE) | (dists > MAX_RANGE)] = FLAG_INVALID
+        weak = self.random.random(360) < self.weak
+        flags[weak] |= FLAG_WEAK
+        quals[weak] /= 10
+
+        packets = encode_revolution(np.round(dists), quals, flags, self.rpm)
+        raw = packets.view(np.uint8).reshape(90, PACKET_LEN).copy()
+
+        corrupted = np.flatnonzero(self.random.random(90) < self.corrupt)
+        positions = self.random.integers(2, PACKET_LEN, len(corrupted))
+        raw[corrupted, positions] ^= 0xFF
+        return raw
+
+    def run(self):
+        period = 60.0 / self.rpm
+        # write 10 packets at a time, spread over the revolution
+        chunks = 9
+        next_write = time.time()
+        while not self.quit:
+            raw = self.revolution()
+            for chunk in np.split(raw, chunks):
+                try:
+                    os.write(self.master, chunk.tobytes())
+                except BlockingIOError:
+                    pass
+                next_write += period / chunks
+                delay = next_write - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            self.revolutions += 1
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.quit = True
+        self.thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stream synthetic Neato packets to a pty.')
+    parser.add_argument('--config', default=os.environ.get('BOT_CONFIG', 'data/config.json'))
+    parser.add_argument('--pos', type=float, nargs=2, help='position in map units, START_POS by default')
+    parser.add_argument('--dir', type=float, nargs=2, help='direction vector, START_DIR by default')
+    parser.add_argument('--rpm', type=float, default=300)
+    parser.add_argument('--noise', type=float, default=0.0, help='distance noise in mm')
+    parser.add_argument('--weak', type=float, default=0.0, help='fraction of weak readings')
+    parser.add_argument('--corrupt', type=float, default=0.0, help='fraction of corrupted packets')
+    parser.add_argument('--scale', type=float, default=20.0, help='mm per map unit')
+    parser.add_argument('--link', help='also make the pty available at this path')
+    args = parser.parse_args()
+
+    with open(args.config) as config_file:
+        config = json.load(config_file)
+    map_name = os.path.join(os.path.dirname(args.config), config['MAP'])
+    with open(map_name) as map_file:
+        map = json.load(map_file)
+
+    fake = FakeNeato(map, args.pos or config['START_POS'], args.dir or config['START_DIR'],
+                     rpm=args.rpm, noise=args.noise, weak=args.weak, corrupt=args.corrupt,
+                     scale=args.scale)
+    if args.link:
+        if os.path.lexists(args.link):
+            os.remove(args.link)
+        os.symlink(fake.port, args.link)
+    print('streaming on {}'.format(args.link or fake.port))
+
+    fake.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print('stopping.')
+    finally:
+        fake.stop()
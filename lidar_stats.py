@@ -0,0 +1,96 @@
+import json
+import time
+import numpy as np
+from scan import FLAG_INVALID, FLAG_WEAK
+
+# upper edges of the decode latency histogram buckets, in microseconds
+LATENCY_BUCKETS = [50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000]
+
+# seconds between two rate measurements
+STATS_INTERVAL = 1.0
+
+
+class LidarStats:
+    """
+    Health and throughput counters of a lidar reader.
+
+    Totals are updated by the reader for every chunk it decodes. Rates are measured over
+    STATS_INTERVAL and, if a file is given, appended to it as one JSON line per interval.
+    """
+
+    def __init__(self, size=360, interval=STATS_INTERVAL, path=None):
+        self.interval = interval
+        self.file = open(path, 'a') if path is not None else None
+
+        self.packets = 0
+        self.nb_errors = 0
+        self.invalid = np.zeros(size, dtype=np.int64)
+        self.weak = np.zeros(size, dtype=np.int64)
+        self.latency = np.zeros(len(LATENCY_BUCKETS) + 1, dtype=np.int64)
+        self.rpm = 0.0
+
+        self.rates = {'packets_per_s': 0.0, 'revolutions_per_s': 0.0, 'error_rate': 0.0}
+        self.mark_time = time.time()
+        self.mark_packets = 0
+        self.mark_errors = 0
+        self.mark_revolutions = 0
+
+    def record(self, nb_packets, nb_errors, angles, flags, rpms, latency):
+        """
+        Counts one decoded chunk.
+
+        latency -- seconds between the chunk arriving and its samples being stored
+        """
+        self.packets += nb_packets
+        self.nb_errors += nb_errors
+        if nb_packets > 0:
+            size = len(self.invalid)
+            self.invalid += np.bincount(angles[(flags & FLAG_INVALID) > 0], minlength=size)
+            self.weak += np.bincount(angles[(flags & FLAG_WEAK) > 0], minlength=size)
+            self.rpm = float(rpms.mean())
+            self.latency[np.searchsorted(LATENCY_BUCKETS, latency * 1e6)] += 1
+
+    def tick(self, revolutions):
+        """
+        Measures the rates once the interval has passed, dumping them if a file was given.
+        """
+        now = time.time()
+        elapsed = now - self.mark_time
+        if elapsed < self.interval:
+            return
+
+        packets = self.packets - self.mark_packets
+        errors = self.nb_errors - self.mark_errors
+        self.rates = {
+            'packets_per_s': packets / elapsed,
+            'revolutions_per_s': (revolutions - self.mark_revolutions) / elapsed,
+            'error_rate': errors / max(packets + errors, 1),
+        }
+        self.mark_time = now
+        self.mark_packets = self.packets
+        self.mark_errors = self.nb_errors
+        self.mark_revolutions = revolutions
+
+        if self.file is not None:
+            self.file.write(json.dumps(dict(self.snapshot(), time=now)) + '\n')
+            self.file.flush()
+
+    def snapshot(self):
+        """
+        Returns the counters as a dict of plain values.
+        """
+        stats = dict(self.rates)
+        stats.update({
+            'packets': self.packets,
+            'checksum_errors': self.nb_errors,
+            'rpm': self.rpm,
+            'invalid_per_angle': self.invalid.tolist(),
+            'weak_per_angle': self.weak.tolist(),
+            'latency_buckets_us': LATENCY_BUCKETS,
+            'latency_histogram': self.latency.tolist(),
+        })
+        return stats
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
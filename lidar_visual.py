@@ -6,6 +6,7 @@ import math
 import time
 import numpy as np
 import wall
+from scan import COS, SIN
 
 def map_value(value, in_min, in_max, out_min, out_max):
     percent = float(value - in_min) / (in_max/out_max)
@@ -54,8 +55,9 @@ class LidarVisualizer:
         
         self.height = win_h
         self.width = win_w
-        self.raw_data = []
+        self.raw_data = None
         self.points = []
+        self.seq = 0
 
         self.running = True
         self.mode = EUCLID_3D
@@ -64,8 +66,8 @@ class LidarVisualizer:
         self.window = sdl2.ext.Window("LIDAR Visualizer", size=(win_w, win_h))
         self.window.show()
 
-    def update_data(self, distances):
-        self.raw_data = distances
+    def update_data(self, frame):
+        self.raw_data = frame
     
     def graph_dists(self, surface, dists, colors):
         white = sdl2.ext.Color(255, 255, 255)
@@ -77,8 +79,8 @@ class LidarVisualizer:
            pix_view[i][self.height - dists[i] - 1] = colors[i]
 
     def draw_raw(self):
-        dists = [d[0] for d in self.raw_data]
-        quals = [q[1] for q in self.raw_data]
+        dists = self.raw_data.distances.tolist()
+        quals = self.raw_data.qualities
         colors = []
         
         max_dist = max(dists)
@@ -102,21 +104,18 @@ class LidarVisualizer:
         self.graph_dists(win_surf, dists, colors)
         
     def draw_polar(self):
-        dists = [d[0] for d in self.raw_data]
-        quals = [q[1] for q in self.raw_data]
+        dists = self.raw_data.distances
+        quals = self.raw_data.qualities
 
         max_dist = max(dists)
         max_qual = max(quals)
 
         coords = []
         colors = []
+        points = self.raw_data.points / MAX_DIST
         
         for i in range(len(self.raw_data)):
-            c = math.cos(math.pi * i / 180)
-            s = math.sin(math.pi * i / 180)
-            
-            x = (c * dists[i]) / MAX_DIST
-            z = (s * dists[i]) / MAX_DIST
+            x, z = points[i]
             
             r = float(max_qual - quals[i]) / max_qual
             g = float(quals[i])/max_qual
@@ -150,51 +149,34 @@ class LidarVisualizer:
         
     
     def draw_3D(self):
-        dists = [d[0] for d in self.raw_data]
-        quals = [q[1] for q in self.raw_data]
-        dists = dists[90:270]
-        
-        max_dist = max(dists)
-        max_qual = max(quals)
-
-        coords = []
-        colors = []
-        
-        for i in range(len(dists)):
-            c = -math.cos(math.pi * i / 180)
-            s = math.sin(math.pi * i / 180)
-            
-            x = c * dists[i]
-            z = s * dists[i]
-             
-            if(z <= 0.0):
-                continue
-            
-            r = float(max_qual - quals[i]) / max_qual
-            g = float(quals[i])/max_qual
-            b = 1.0
-            
-            gray = 1.0 - (dists[i] / max_dist)
-            r = r * gray
-            g = g * gray
-            b = gray
-            
-            color = sdl2.ext.Color(int(255*r), int(255*g), int(255*b))
-            colors.append(color)
-            
-            floor = (np.array([x, self.height, z, 1]) * self.projection).A1
-            ceil = (np.array([x, -self.height, z, 1]) * self.projection).A1
-
-            floor = floor/floor[3]
-            ceil = ceil/ceil[3]
-            
-            floor = (floor * self.viewport).A1
-            ceil = (ceil * self.viewport).A1
-            
-            floor = np.array([int(floor[0]), int(floor[1]), int(floor[2])])
-            ceil = np.array([int(ceil[0]), int(ceil[1]), int(ceil[2])])
-            
-            coords.append((floor, ceil))
+        # the front half of the revolution
+        dists = self.raw_data.distances[90:270].astype(np.float64)
+        quals = self.raw_data.qualities[90:270].astype(np.float64)
+        
+        max_dist = max(dists.max(), 1)
+        max_qual = max(quals.max(), 1)
+        
+        xs = -COS[:len(dists)] * dists
+        zs = SIN[:len(dists)] * dists
+        visible = zs > 0.0
+        xs, zs, dists, quals = xs[visible], zs[visible], dists[visible], quals[visible]
+        
+        gray = 1.0 - dists / max_dist
+        reds = (255 * (max_qual - quals) / max_qual * gray).astype(int)
+        greens = (255 * quals / max_qual * gray).astype(int)
+        blues = (255 * gray).astype(int)
+        colors = [sdl2.ext.Color(r, g, b) for r, g, b in zip(reds, greens, blues)]
+        
+        # floor and ceiling of every sample, projected and mapped to the screen at once
+        ones = np.ones(len(xs))
+        floors = np.column_stack((xs, np.full(len(xs), self.height), zs, ones))
+        ceils = np.column_stack((xs, np.full(len(xs), -self.height), zs, ones))
+        screen = []
+        for corners in (floors, ceils):
+            projected = np.asarray(corners * self.projection)
+            projected = projected / projected[:, 3:4]
+            screen.append(np.asarray(projected * self.viewport).astype(int))
+        coords = list(zip(screen[0], screen[1]))
         
         win_surf = self.window.get_surface()
         
@@ -207,22 +189,18 @@ class LidarVisualizer:
             x2 = coords[i][1][0]
             y2 = coords[i][1][1]
             
-            if x < 0 or x > self.width:
+            if x1 < 0 or x1 > self.width:
                 continue
             
             values = (x1, y1, x2, y2)
             sdl2.ext.line(win_surf, colors[i], values)
     
-    def filtered_points(self):
-        dist_filtered = [d for d in enumerate(self.raw_data) if d[1][0] >= 150] #ignore things still on the robot
-        qual_filtered = [q for q in dist_filtered if q[1][1] > 0] #ignore things that cannot be read correctly
-        return qual_filtered
-    
     def draw_filtered_polar(self):
-        points = self.filtered_points()
-        angles = [a[0] for a in points]
-        dists = [d[1][0] for d in points]
-        quals = [q[1][1] for q in points]
+        #ignore things still on the robot or that cannot be read correctly
+        angles, filtered, points = self.raw_data.filtered()
+        dists = filtered[:, 0]
+        quals = filtered[:, 1]
+        points = points / MAX_DIST
         
         max_dist = max(dists)
         max_qual = max(quals)
@@ -231,11 +209,7 @@ class LidarVisualizer:
         colors = []
         
         for i in range(len(points)):
-            c = math.cos(math.pi * angles[i] / 180)
-            s = math.sin(math.pi * angles[i] / 180)
-            
-            x = (dists[i] * c) / MAX_DIST
-            z = (dists[i] * s) / MAX_DIST
+            x, z = points[i]
         
             r = float(max_qual - quals[i]) / max_qual
             g = float(quals[i])/max_qual
@@ -268,7 +242,7 @@ class LidarVisualizer:
             pix_view[pixel_y][pixel_x] = color
     
     def draw_pretty_polar(self):
-        walls = wall.find_walls(self.filtered_points())
+        walls = wall.find_walls(self.raw_data)
         win_surf = self.window.get_surface()
         
         white = sdl2.ext.Color(255, 255, 255)
@@ -332,12 +306,12 @@ class LidarVisualizer:
             x += 1
     
     def draw_pretty_3D(self):
-        filtered = self.filtered_points()
+        angles, filtered, points = self.raw_data.filtered()
         
-        max_dist = max([d[1][0] for d in filtered])
-        max_qual = max([q[1][1] for q in filtered])
+        max_dist = filtered[:, 0].max()
+        max_qual = filtered[:, 1].max()
         
-        walls = wall.find_walls(filtered)
+        walls = wall.find_walls(self.raw_data)
         
         quads = []
         colors = []
@@ -401,7 +375,6 @@ class LidarVisualizer:
     
     def refresh(self):
         event = sdl2.SDL_Event()
-        self.update_data(self.lidar.get_image())
         while sdl2.SDL_PollEvent(ctypes.byref(event)) != 0:
             if event.type == sdl2.SDL_QUIT:
                 self.running = False
@@ -419,7 +392,13 @@ class LidarVisualizer:
                     self.mode = PRETTY_POLAR
                 elif event.key.keysym.sym == sdl2.SDLK_5:
                     self.mode = PRETTY_3D
-                        
+        
+        frame = self.lidar.latest()
+        if frame is None or frame.seq == self.seq:
+            return
+        self.seq = frame.seq
+        self.update_data(frame)
+        
         if self.mode == RAW:
             self.draw_raw()
         elif self.mode == POLAR:
@@ -0,0 +1,190 @@
+"""
+    Particle filter localization
+    ============================
+
+    Tracks the pose of the bot in the map with a set of particles:
+
+        predict -- moves every particle with the motor values in effect, plus noise
+        update -- weighs every particle by how well the revolution matches the distances the
+                  map predicts from its pose, and resamples once few particles carry the weight
+
+    The distances the map predicts are looked up in a table ray cast once per map for every
+    cell of a grid and every degree, so an update is a gather and a few array operations for
+    all particles at once. The table is cached in CACHE_DIR under the hash of the map.
+    """
+
+import hashlib
+import math
+import os
+import time
+import numpy as np
+
+import raycast
+
+SCALE = 20.0  # mm per map unit
+PARTICLES = 2000
+CELL = 50.0  # mm, grid of the ray cast table
+BEAMS = 36  # samples of a revolution compared per particle
+SIGMA = 100.0  # mm, standard deviation of a measured distance
+OUTLIER = 0.05  # share of the likelihood given to readings the map does not explain
+MAX_RANGE = 6000.0  # mm, farthest distance the lidar measures
+MAX_SPEED = 500.0  # mm/s at full command
+MAX_TURN_RATE = 3.0  # radians/s at full command
+MOTION_NOISE = (0.2, 0.1)  # standard deviation of speed and turn rate, relative to full command
+# standard deviation of the position and heading noise of every prediction, in mm and radians,
+# so particles keep spreading while the commands say the bot stands still or it is stuck
+JITTER = (20.0, 0.03)
+INIT_SPREAD = (100.0, 0.2)  # standard deviation of the start pose, mm and radians
+
+
+def build_table(segments, origin, shape, cell, max_range=MAX_RANGE):
+    """
+    Ray casts the centre of every cell of a grid at every degree.
+
+    Returns an array of shape shape + (360,) of float32 distances in mm.
+    """
+    ij = np.stack(np.meshgrid(np.arange(shape[0]), np.arange(shape[1]), indexing='ij'), axis=-1)
+    centres = (origin + (ij + 0.5) * cell).reshape(-1, 2)
+    angles = np.radians(np.arange(360))
+
+    table = np.empty((len(centres), 360), dtype=np.float32)
+    chunk = 64  # cells per cast, bounds the size of the temporaries
+    for start in range(0, len(centres), chunk):
+        origins = centres[start:start + chunk, None, :]
+        table[start:start + chunk] = raycast.cast(segments, origins, angles, max_range)
+    return table.reshape(tuple(shape) + (360,))
+
+
+class Localizer:
+    """
+    map -- the map, in map units
+    position, direction -- start pose in map units, START_POS and START_DIR
+    config -- optional dict, the LOCALIZATION setting:
+        PARTICLES -- number of particles
+        SCALE -- mm per map unit
+        CELL -- cell size of the ray cast table in mm
+        BEAMS -- samples of a revolution compared per particle
+        SIGMA -- standard deviation of a measured distance in mm
+        MAX_SPEED -- speed in mm/s at full command
+        MAX_TURN_RATE -- turn rate in radians/s at full command
+        CACHE_DIR -- folder the ray cast table is cached in
+    """
+
+    def __init__(self, map, position, direction, config=None, seed=None):
+        config = config or {}
+        self.scale = config.get('SCALE', SCALE)
+        self.cell = config.get('CELL', CELL)
+        self.beams = config.get('BEAMS', BEAMS)
+        self.sigma = config.get('SIGMA', SIGMA)
+        self.max_speed = config.get('MAX_SPEED', MAX_SPEED)
+        self.max_turn_rate = config.get('MAX_TURN_RATE', MAX_TURN_RATE)
+        self.random = np.random.default_rng(seed)
+
+        segments = raycast.load_segments(map) * self.scale
+        points = segments.reshape(-1, 2)
+        self.origin = points.min(axis=0)
+        self.shape = np.ceil((points.max(axis=0) - self.origin) / self.cell).astype(int)
+        self.table = self.load_table(segments, config.get('CACHE_DIR'))
+
+        count = config.get('PARTICLES', PARTICLES)
+        self.xy = np.asarray(position, dtype=np.float64) * self.scale \
+            + self.random.normal(0, INIT_SPREAD[0], (count, 2))
+        self.theta = raycast.heading(direction) + self.random.normal(0, INIT_SPREAD[1], count)
+        self.weights = np.full(count, 1.0 / count)
+
+        self.update_time = 0.0
+
+    def load_table(self, segments, cache_dir):
+        if cache_dir is None:
+            return build_table(segments, self.origin, self.shape, self.cell)
+
+        key = hashlib.sha1(segments.tobytes() + np.float64(self.cell).tobytes()).hexdigest()
+        cache_name = os.path.join(cache_dir, 'raycast-{}.npy'.format(key))
+        try:
+            return np.load(cache_name)
+        except (OSError, ValueError):
+            pass
+        table = build_table(segments, self.origin, self.shape, self.cell)
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_name + '.tmp', 'wb') as cache_file:
+            np.save(cache_file, table)
+        os.replace(cache_name + '.tmp', cache_name)
+        return table
+
+    def predict(self, left, right, dt):
+        """
+        Moves the particles for dt seconds with the motor values left and right of arcade.
+        """
+        if dt <= 0:
+            return
+        count = len(self.weights)
+        # same kinematics as the simulator, a positive angle turns clockwise
+        speed = (left + right) / 2 + self.random.normal(0, MOTION_NOISE[0], count)
+        turn = (left - right) / 2 + self.random.normal(0, MOTION_NOISE[1], count)
+
+        self.theta = self.theta + turn * self.max_turn_rate * dt \
+            + self.random.normal(0, JITTER[1], count)
+        step = speed * self.max_speed * dt
+        self.xy = self.xy + step[:, None] * np.stack([np.cos(self.theta), np.sin(self.theta)], axis=-1) \
+            + self.random.normal(0, JITTER[0], (count, 2))
+
+    def update(self, distances):
+        """
+        Weighs the particles with a revolution of distances in mm, 0 where invalid.
+        """
+        start = time.perf_counter()
+        distances = np.asarray(distances, dtype=np.float64)
+        size = len(distances)
+        samples = np.linspace(0, size, self.beams, endpoint=False).astype(int)
+        samples = samples[distances[samples] > 0]
+        if len(samples) == 0:
+            return
+
+        measured = distances[samples]
+        # world angle of every compared sample for every particle, in degrees
+        offsets = (raycast.FORWARD_INDEX - samples) * 360.0 / size
+        degrees = np.degrees(self.theta)[:, None] + offsets
+        bins = np.round(degrees).astype(np.intp) % 360
+
+        cells = np.floor((self.xy - self.origin) / self.cell).astype(np.intp)
+        inside = np.all((cells >= 0) & (cells < self.shape), axis=1)
+        cells = np.clip(cells, 0, self.shape - 1)
+        expected = self.table[cells[:, 0, None], cells[:, 1, None], bins]
+
+        error = (measured - expected) / self.sigma
+        likelihood = (1 - OUTLIER) * np.exp(-0.5 * error ** 2) + OUTLIER
+        log_weight = np.log(likelihood).sum(axis=1)
+        log_weight[~inside] = -np.inf
+
+        best = log_weight.max()
+        if not np.isfinite(best):
+            # every particle left the map, keep them as they are
+            return
+        weights = self.weights * np.exp(log_weight - best)
+        self.weights = weights / weights.sum()
+
+        if 1.0 / (self.weights ** 2).sum() < len(self.weights) / 2:
+            self.resample()
+        self.update_time = time.perf_counter() - start
+
+    def resample(self):
+        """
+        Systematic resampling, particles are copied in proportion to their weight.
+        """
+        count = len(self.weights)
+        positions = (self.random.random() + np.arange(count)) / count
+        cumulative = np.cumsum(self.weights)
+        cumulative[-1] = 1.0
+        chosen = np.searchsorted(cumulative, positions)
+        self.xy = self.xy[chosen]
+        self.theta = self.theta[chosen]
+        self.weights = np.full(count, 1.0 / count)
+
+    def estimate(self):
+        """
+        Returns the weighted mean pose as (position, direction) in map units.
+        """
+        xy = (self.xy * self.weights[:, None]).sum(axis=0) / self.scale
+        theta = math.atan2((np.sin(self.theta) * self.weights).sum(),
+                           (np.cos(self.theta) * self.weights).sum())
+        return [float(xy[0]), float(xy[1])], [math.cos(theta), math.sin(theta)]
@@ -1,113 +1,163 @@
+import time
+STARTED = time.perf_counter()  # before the other imports, they are part of the startup
+
 import json
 import os
 import sys
-import threading
-import time
 
-import picoborgrev3.PicoBorgRev as PiBorg
+from ai_process import ProcessAI
 from driver import LidarBot
-
-# internal config
-WATCHDOG_TIMEOUT = 1
-
-# setup lib
-PBR = PiBorg.PicoBorgRev()
-PBR.Init()
-
-# validate board is found
-if not PBR.foundChip:
-    boards = PiBorg.ScanForPicoBorgReverse()
-    if len(boards) == 0:
-        print('No PicoBorg Reverse found, check you are attached :)')
+from motors import MockPicoBorgRev
+from scan import EndOfScans
+from scheduler import Scheduler
+from startup import StartupTimer, load_map, load_board_address, save_board_address, start_lidar
+from watchdog import Watchdog
+
+
+def setup_board(config):
+    if config.get('MOCK_MOTORS'):
+        return MockPicoBorgRev()
+
+    import picoborgrev3.PicoBorgRev as PiBorg
+
+    # setup lib, at the address found last time if any
+    PBR = PiBorg.PicoBorgRev()
+    address_file = os.path.join(config['CACHE_DIR'], 'board_address')
+    address = load_board_address(address_file)
+    if address is not None:
+        PBR.i2cAddress = address
+    PBR.Init()
+
+    # validate board is found, scanning the bus is slow so it is only done when it is not
+    if not PBR.foundChip:
+        boards = PiBorg.ScanForPicoBorgReverse()
+        if len(boards) == 0:
+            print('No PicoBorg Reverse found, check you are attached :)')
+            sys.exit()
+        print('No PicoBorg Reverse at address %02X, using the one at %02X' % (PBR.i2cAddress, boards[0]))
+        PBR.i2cAddress = boards[0]
+        PBR.Init()
+        if not PBR.foundChip:
+            sys.exit()
+    if PBR.i2cAddress != address:
+        save_board_address(address_file, PBR.i2cAddress)
+
+    # emergency stop, needs hardware btn (currently a jumper)
+    PBR.ResetEpo()
+    return PBR
+
+
+def load_config(timer=None):
+    timer = timer or StartupTimer()
+
+    # read config
+    with timer.phase('config'):
+        config_name = os.environ.get('BOT_CONFIG', 'data/config.json')
+        with open(config_name) as config_file:
+            config = json.load(config_file)
+        config.setdefault('CACHE_DIR', os.path.join(os.path.dirname(config_name), 'cache'))
+
+    with timer.phase('map'):
+        map_name = os.path.join(os.path.dirname(config_name), config['MAP'])
+        map = load_map(map_name, config['CACHE_DIR'])
+
+    return config, map
+
+
+def load_ai(config):
+    ai_name = config['AI']
+    if 'AI_PROCESS' in config:
+        # the worker gets the map once, the live grid and planner would be lost or stale there
+        live = [name for name in ('OCCUPANCY', 'PLANNER') if name in config]
+        if live:
+            raise ValueError('AI_PROCESS cannot be used with {}'.format(' or '.join(live)))
+        return ProcessAI(ai_name, config.get('AI_CONFIG'), config['AI_PROCESS'])
+    ai_module = __import__(ai_name)
+    if 'AI_CONFIG' in config:
+        return ai_module.AI(config['AI_CONFIG'])
     else:
-        print('No PicoBorg Reverse at address %02X, but we did find boards:' % (PBR.i2cAddress))
-        for board in boards:
-            print('    %02X (%d)' % (board, board))
-        print('If you need to change the I²C address change the setup line so it is correct, e.g.')
-        print('PBR.i2cAddress = 0x%02X' % (boards[0]))
-    sys.exit()
-
-# emergency stop, needs hardware btn (currently a jumper)
-PBR.ResetEpo()
-
-
-# watchdog thread to kill motors if program goes unresponsive
-class Watchdog(threading.Thread):
-    timed_out = False
-
-    def __init__(self):
-        super(Watchdog, self).__init__()
-        self.event = threading.Event()
-        self.terminated = False
-        self.start()
-        self.timestamp = time.time()
-
-    def feed(self):
-        self.event.set()
-
-    def stop(self):
-        self.terminated = True
-        self.event.set()
-        self.join()
-
-    def run(self):
-        # This method runs in a separate thread
-        while not self.terminated:
-            # Wait for a network event to be flagged for up to one second
-            if self.timed_out:
-                if self.event.wait(WATCHDOG_TIMEOUT):
-                    # Connection
-                    print('Reconnected...')
-                    self.timed_out = False
-                    self.event.clear()
-            else:
-                if self.event.wait(WATCHDOG_TIMEOUT):
-                    self.event.clear()
-                else:
-                    # Timed out
-                    print('Timed out...')
-                    self.timed_out = True
-                    PBR.MotorsOff()
-
-
-# read config
-config_name = os.environ.get('BOT_CONFIG', 'data/config.json')
-with open(config_name) as config_file:
-    config = json.load(config_file)
-
-map_name = os.path.join(os.path.dirname(config_name), config['MAP'])
-with open(map_name) as map_file:
-    map = json.load(map_file)
-
-ai_name = config['AI']
-ai_module = __import__(ai_name)
-if 'AI_CONFIG' in config:
-    ai = ai_module.AI(config['AI_CONFIG'])
-else:
-    ai = ai_module.AI()
-
-# setup bot driver
-bot = LidarBot(PBR, ai, map, config)
-watchdog = Watchdog()
-
-# drive!
-try:
-    while True:
-        bot.update()
-
-        if watchdog.timed_out:
-            print('watchdog timed out, quitting')
-            break
+        return ai_module.AI()
+
+
+def main():
+    timer = StartupTimer(STARTED)
+    config, map = load_config(timer)
+
+    # the lidar needs a full revolution before the bot can drive, start it first
+    lidar_future = start_lidar(config, timer)
+    try:
+        with timer.phase('board'):
+            PBR = setup_board(config)
+        with timer.phase('ai'):
+            ai = load_ai(config)
+    except BaseException:
+        # don't leave the reader thread running
+        if lidar_future.exception() is None:
+            lidar_future.result().quit = True
+        raise
+
+    # setup bot driver, the localizer table and planner grids are built or loaded here
+    lidar = lidar_future.result()
+    with timer.phase('bot'):
+        bot = LidarBot(PBR, ai, map, config, lidar=lidar)
+    watchdog = Watchdog(bot.motors.off, config.get('WATCHDOG'))
+    bot.set_watchdog(watchdog)
+    with timer.phase('first scan'):
+        try:
+            first = bot.lidar.get_image(timeout=bot.scan_timeout)
+        except EndOfScans:
+            first = None  # the loop below gets it again and quits
+    print(timer.report())
+
+    scheduler = None
+    if 'CONTROL_RATE' in config:
+        scheduler = Scheduler()
+        scheduler.add('control', config['CONTROL_RATE'], bot.poll)
+        if 'MOTOR_RATE' in config:
+            scheduler.add('motor', config['MOTOR_RATE'], bot.motor_tick)
+
+        def on_tick():
+            if watchdog.timed_out:
+                print('watchdog timed out, quitting')
+                scheduler.stop()
+        scheduler.on_tick = on_tick
+
+    # drive!
+    try:
+        if first is not None:
+            # the first revolution is the AI's too, a replay does not hand it out twice
+            bot.process(first)
+        if scheduler is not None:
+            scheduler.run()
         else:
-            watchdog.feed()
-except KeyboardInterrupt:
-    print('shutting down.')
-finally:
-    # cleanup
-    bot.stop()
-    watchdog.stop()
-
-    # kill motors
-    PBR.MotorsOff()
-
-    print('exiting.')
+            while True:
+                bot.update()
+
+                if watchdog.timed_out:
+                    print('watchdog timed out, quitting')
+                    break
+    except EndOfScans:
+        print('out of revolutions, quitting')
+    except KeyboardInterrupt:
+        print('shutting down.')
+    finally:
+        # cleanup, the watchdog first as stopping the lidar misses its deadline
+        watchdog.stop()
+        bot.stop()
+        print(json.dumps(watchdog.stats(), indent=2))
+        if scheduler is not None:
+            print(json.dumps(scheduler.stats(), indent=2))
+        if isinstance(ai, ProcessAI):
+            print(json.dumps(ai.stats(), indent=2))
+            ai.close()
+
+        # kill motors
+        bot.motors.off()
+        if isinstance(PBR, MockPicoBorgRev):
+            print('I²C transactions: {}'.format(PBR.summary()))
+
+        print('exiting.')
+
+
+if __name__ == '__main__':
+    main()
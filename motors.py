@@ -0,0 +1,189 @@
+import threading
+import time
+
+# motor values closer than this are the same command
+TOLERANCE = 1e-3
+# seconds off waits for a write in progress before turning the motors off regardless
+OFF_LOCK_TIMEOUT = 0.005
+
+
+class MotorCommander:
+    """
+    Sends motor values to a PicoBorg Reverse without repeating itself.
+
+    A motor is only written when its value changed, and values move towards the requested
+    ones by at most SLEW_RATE per second, starting from off. With RATE set, a thread of its own applies the
+    requested values that many times per second and set only stores them.
+
+    config -- the MOTORS setting:
+        SLEW_RATE -- largest change of a motor value per second, no limit by default
+        RATE -- writes per second of the motor thread, no thread by default
+    """
+
+    def __init__(self, PBR, config=None):
+        config = config or {}
+        self.PBR = PBR
+        self.slew_rate = config.get('SLEW_RATE')
+        self.rate = config.get('RATE')
+
+        self.target = (0.0, 0.0)
+        self.current = [0.0, 0.0]  # last written values, the motors start off
+        self.written = [False, False]  # whether a motor was written, its first value always is
+        self.last_apply = None  # the slew limit counts from the first apply, not from startup
+        self.lock = threading.Lock()
+
+        self.writes = 0
+        self.suppressed = 0
+
+        self.watchdog = None  # beaten while a motor is written
+        self.stopped = False  # set by off, no motor is written after it
+        self.quit = False
+        self.thread = None
+        if self.rate:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def set(self, motor1, motor2):
+        """
+        Requests new motor values.
+        """
+        self.target = (motor1, motor2)
+        if self.thread is None:
+            self.apply()
+
+    def apply(self):
+        """
+        Moves the motors towards the requested values, writing only the ones that changed.
+        """
+        with self.lock:
+            now = time.monotonic()
+            elapsed = 0.0 if self.last_apply is None else now - self.last_apply
+            self.last_apply = now
+
+            for motor, target in enumerate(self.target):
+                value = target
+                current = self.current[motor]
+                if self.slew_rate is not None:
+                    step = self.slew_rate * elapsed
+                    value = min(max(target, current - step), current + step)
+
+                if self.written[motor] and abs(value - current) < TOLERANCE:
+                    self.suppressed += 1
+                    continue
+                if self.stopped:
+                    return
+
+                if self.watchdog is not None:
+                    self.watchdog.beat('motor')
+                if motor == 0:
+                    self.PBR.SetMotor1(value)
+                else:
+                    self.PBR.SetMotor2(value)
+                if self.watchdog is not None:
+                    self.watchdog.done('motor')
+                if self.stopped:
+                    # off ran while this write was stuck, its value may have landed after
+                    # MotorsOff
+                    self.PBR.MotorsOff()
+                    self.writes += 1
+                    return
+                self.current[motor] = value
+                self.written[motor] = True
+                self.writes += 1
+
+    def run(self):
+        period = 1.0 / self.rate
+        next_apply = time.monotonic()
+        while not self.quit:
+            self.apply()
+            next_apply += period
+            delay = next_apply - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_apply = time.monotonic()
+
+    def off(self):
+        """
+        Turns both motors off right away, bypassing the slew limit, and for good.
+
+        A write stuck in apply is only waited for OFF_LOCK_TIMEOUT; apply turns the motors off
+        again once that write returns and writes nothing after it.
+        """
+        self.stopped = True
+        locked = self.lock.acquire(timeout=OFF_LOCK_TIMEOUT)
+        try:
+            self.target = (0.0, 0.0)
+            self.PBR.MotorsOff()
+            self.current = [0.0, 0.0]
+            self.written = [True, True]
+            self.writes += 1
+        finally:
+            if locked:
+                self.lock.release()
+
+    def stop(self):
+        """
+        Stops the motor thread and turns the motors off.
+        """
+        self.quit = True
+        if self.thread is not None:
+            self.thread.join()
+        self.off()
+
+
+class MockPicoBorgRev:
+    """
+    Stands in for picoborgrev3.PicoBorgRev off the robot.
+
+    Every command is kept in timeline as (time, command, value), and transactions counts the
+    I²C transactions a real board would have seen.
+    """
+
+    def __init__(self):
+        self.foundChip = True
+        self.i2cAddress = 0x44
+        self.motor1 = 0.0
+        self.motor2 = 0.0
+        self.timeline = []
+        self.transactions = 0
+
+    def command(self, name, value=None):
+        self.timeline.append((time.monotonic(), name, value))
+        self.transactions += 1
+
+    def Init(self):
+        pass
+
+    def ResetEpo(self):
+        self.command('ResetEpo')
+
+    def SetMotor1(self, power):
+        self.motor1 = power
+        self.command('SetMotor1', power)
+
+    def SetMotor2(self, power):
+        self.motor2 = power
+        self.command('SetMotor2', power)
+
+    def GetMotor1(self):
+        self.command('GetMotor1')
+        return self.motor1
+
+    def GetMotor2(self):
+        self.command('GetMotor2')
+        return self.motor2
+
+    def MotorsOff(self):
+        self.motor1 = 0.0
+        self.motor2 = 0.0
+        self.command('MotorsOff')
+
+    def summary(self):
+        """
+        Returns the number of transactions per command.
+        """
+        counts = {}
+        for _, name, _ in self.timeline:
+            counts[name] = counts.get(name, 0) + 1
+        return counts
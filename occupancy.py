@@ -0,0 +1,217 @@
+"""
+    Occupancy grid
+    ==============
+
+    A live map built from the revolutions of the lidar, for what map.json does not know about
+    like furniture and people.
+
+    Every cell holds the log-odds of being occupied. For a revolution, the cells along every ray
+    up to its reading become more likely free and the cell the reading ends in more likely
+    occupied; all rays are traced at once as one array of sample points, and every cell is
+    updated at most once per revolution.
+
+    Cells are stored in square tiles allocated the first time a ray reaches them. Only MAX_TILES
+    tiles are kept, the least recently updated one is dropped to make room for a new one, so
+    memory stays bounded however far the bot drives.
+
+    Positions are in map units like map.json and bot.position, distances in mm.
+    """
+
+import math
+from collections import OrderedDict
+import numpy as np
+
+import raycast
+
+SCALE = 20.0  # mm per map unit
+RESOLUTION = 50.0  # mm per cell
+TILE = 64  # cells per side of a tile
+MAX_TILES = 256
+MAX_RANGE = 4000.0  # mm, rays are only traced this far
+HIT = 0.85  # log-odds added to the cell a reading ends in
+MISS = -0.4  # log-odds added to the cells a ray crosses
+LIMIT = 5.0  # log-odds are clamped to +-LIMIT so a cell can change its mind again
+FREE = -0.5  # log-odds below which a cell is free
+OCCUPIED = 0.5  # log-odds above which a cell is occupied
+
+
+def cell_keys(cells):
+    """
+    Packs integer cell coordinates of shape (N, 2) into one int64 per cell.
+    """
+    cells = cells.astype(np.int64)
+    return (cells[:, 0] << 32) | (cells[:, 1] & 0xFFFFFFFF)
+
+
+def key_cells(keys):
+    x = keys >> 32
+    y = ((keys & 0xFFFFFFFF) ^ 0x80000000) - 0x80000000
+    return np.stack([x, y], axis=-1)
+
+
+class OccupancyGrid:
+    """
+    config -- optional dict, the OCCUPANCY setting:
+        SCALE -- mm per map unit
+        RESOLUTION -- mm per cell
+        TILE -- cells per side of a tile
+        MAX_TILES -- tiles kept in memory
+        MAX_RANGE -- mm rays are traced for
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.scale = config.get('SCALE', SCALE)
+        self.resolution = config.get('RESOLUTION', RESOLUTION)
+        self.tile = config.get('TILE', TILE)
+        self.max_tiles = config.get('MAX_TILES', MAX_TILES)
+        self.max_range = config.get('MAX_RANGE', MAX_RANGE)
+
+        self.tiles = OrderedDict()  # (tx, ty) -> float32 log-odds, least recently updated first
+        self.updates = 0
+        self.evicted = 0
+
+    def cells(self, points):
+        """
+        Returns the cell of every point of shape (..., 2) in map units.
+        """
+        return np.floor(np.asarray(points, dtype=np.float64) * self.scale / self.resolution).astype(np.int64)
+
+    def update(self, position, theta, distances):
+        """
+        Adds a revolution seen from position, in map units, with a heading of theta radians.
+
+        distances -- the 360 distances of the revolution in mm, 0 where invalid
+        """
+        distances = np.asarray(distances, dtype=np.float64)
+        samples = np.flatnonzero(distances > 0)
+        if len(samples) == 0:
+            return
+        ranges = distances[samples]
+        angles = raycast.beam_angles(theta, len(distances))[samples]
+        directions = np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+        origin = np.asarray(position, dtype=np.float64) * self.scale
+
+        # sample every ray once per cell size up to its reading, or MAX_RANGE
+        steps = np.arange(0, min(ranges.max(), self.max_range), self.resolution)
+        crossed = steps[None, :] < np.minimum(ranges, self.max_range)[:, None] - self.resolution / 2
+        points = origin + steps[None, :, None] * directions[:, None, :]
+        free = np.unique(cell_keys(np.floor(points[crossed] / self.resolution)))
+
+        hit = ranges <= self.max_range
+        ends = origin + ranges[hit, None] * directions[hit]
+        occupied = np.unique(cell_keys(np.floor(ends / self.resolution)))
+        free = np.setdiff1d(free, occupied, assume_unique=True)
+
+        keys = np.concatenate([free, occupied])
+        deltas = np.concatenate([np.full(len(free), MISS, dtype=np.float32),
+                                 np.full(len(occupied), HIT, dtype=np.float32)])
+        self.add(key_cells(keys), deltas)
+        self.updates += 1
+
+    def add(self, cells, deltas):
+        """
+        Adds deltas to the log-odds of distinct cells, allocating their tiles as needed.
+        """
+        tiles = cells // self.tile
+        local = cells % self.tile
+        tile_keys, inverse = np.unique(cell_keys(tiles), return_inverse=True)
+        for index, (tx, ty) in enumerate(key_cells(tile_keys)):
+            tile = self.tiles.pop((tx, ty), None)
+            if tile is None:
+                tile = np.zeros((self.tile, self.tile), dtype=np.float32)
+                if len(self.tiles) >= self.max_tiles:
+                    self.tiles.popitem(last=False)
+                    self.evicted += 1
+            self.tiles[(tx, ty)] = tile
+
+            mask = inverse == index
+            x, y = local[mask, 0], local[mask, 1]
+            tile[x, y] = np.clip(tile[x, y] + deltas[mask], -LIMIT, LIMIT)
+
+    def log_odds(self, points):
+        """
+        Returns the log-odds of the cell of every point of shape (..., 2), 0 where unknown.
+        """
+        cells = self.cells(points)
+        shape = cells.shape[:-1]
+        cells = cells.reshape(-1, 2)
+        values = np.zeros(len(cells), dtype=np.float32)
+
+        tiles = cells // self.tile
+        local = cells % self.tile
+        tile_keys, inverse = np.unique(cell_keys(tiles), return_inverse=True)
+        for index, (tx, ty) in enumerate(key_cells(tile_keys)):
+            tile = self.tiles.get((tx, ty))
+            if tile is not None:
+                mask = inverse == index
+                values[mask] = tile[local[mask, 0], local[mask, 1]]
+        return values.reshape(shape)
+
+    def is_free(self, points):
+        """
+        Returns True for every point of shape (..., 2) whose cell was seen free, not unknown.
+        """
+        return self.log_odds(points) < FREE
+
+    def is_occupied(self, points):
+        return self.log_odds(points) > OCCUPIED
+
+    def window(self, lower, upper):
+        """
+        Returns the log-odds of the cells from lower to upper, both included, as one array.
+        """
+        values = np.zeros(tuple(upper - lower + 1), dtype=np.float32)
+        for tx in range(lower[0] // self.tile, upper[0] // self.tile + 1):
+            for ty in range(lower[1] // self.tile, upper[1] // self.tile + 1):
+                tile = self.tiles.get((tx, ty))
+                if tile is None:
+                    continue
+                start = np.maximum(lower, (tx * self.tile, ty * self.tile))
+                end = np.minimum(upper + 1, ((tx + 1) * self.tile, (ty + 1) * self.tile))
+                values[start[0] - lower[0]:end[0] - lower[0], start[1] - lower[1]:end[1] - lower[1]] = \
+                    tile[start[0] - tx * self.tile:end[0] - tx * self.tile,
+                         start[1] - ty * self.tile:end[1] - ty * self.tile]
+        return values
+
+    def nearest_obstacle(self, position, max_distance):
+        """
+        Returns the distance in map units from position to the centre of the nearest occupied
+        cell, or inf if there is none within max_distance.
+        """
+        position = np.asarray(position, dtype=np.float64)
+        reach = max_distance * self.scale / self.resolution
+        centre = self.cells(position)
+        lower = centre - int(math.ceil(reach))
+        upper = centre + int(math.ceil(reach))
+        occupied = np.argwhere(self.window(lower, upper) > OCCUPIED)
+        if len(occupied) == 0:
+            return math.inf
+
+        centres = (occupied + lower + 0.5) * self.resolution / self.scale
+        distance = np.sqrt(((centres - position) ** 2).sum(axis=-1)).min()
+        return float(distance) if distance <= max_distance else math.inf
+
+    def memory(self):
+        """
+        Returns the bytes held by the tiles.
+        """
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+
+class LiveMap(np.ndarray):
+    """
+    The wall segments of map.json, as handed to AI.decide, with the occupancy grid attached
+    as map.grid and the path planner as map.planner, None when not in use.
+    """
+
+    def __array_finalize__(self, obj):
+        self.grid = getattr(obj, 'grid', None)
+        self.planner = getattr(obj, 'planner', None)
+
+
+def live_map(map, grid=None, planner=None):
+    live = np.asarray(map, dtype=np.float64).view(LiveMap)
+    live.grid = grid
+    live.planner = planner
+    return live
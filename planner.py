@@ -0,0 +1,339 @@
+"""
+    Global path planner
+    ===================
+
+    Rasterizes the map into a grid of RESOLUTION map units per cell and keeps, for every cell:
+
+        clearance -- distance to the nearest wall, the distance transform of the map
+        cost -- length of the shortest path to GOAL through cells with clearance of RADIUS
+
+    Both are computed once per map and goal and cached in CACHE_DIR under the hash of the map,
+    so a restart only loads them.
+
+    The path of the bot is searched with A* from its cell, around the obstacles the occupancy
+    grid reports and the map does not have, with cost as the heuristic. Obstacles only ever
+    take steps away, so cost is exact where they are not in the way: the search walks straight
+    down it and only spreads around the obstacles, for the length of the detour. It expands at
+    most EXPANSIONS cells per search, and heads for the most promising cell reached when that
+    runs out, so a long detour never stalls the control loop. The path is kept until the
+    obstacles change or the bot leaves it.
+    """
+
+import hashlib
+import heapq
+import math
+import os
+import numpy as np
+
+import occupancy
+import raycast
+
+RESOLUTION = 1.0  # map units per cell
+RADIUS = 5.5  # map units, the bot plus a safety margin
+LOOKAHEAD = 8  # cells between the bot and its next waypoint
+REPLAN_RANGE = 100.0  # map units around the bot obstacles of the occupancy grid are taken from
+EXPANSIONS = 1000  # cells a search expands at most, a few ms
+
+# 8-connected neighbours and the length of the step to them, in cells
+NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1), (0, 1), (1, -1), (1, 0), (1, 1)]
+STEPS = [math.hypot(di, dj) for di, dj in NEIGHBOURS]
+
+
+def segment_distance(segments, points):
+    """
+    Returns the distance from every point of shape (N, 2) to the nearest segment.
+    """
+    a = segments[:, 0]
+    e = segments[:, 1] - a
+    length2 = np.maximum((e ** 2).sum(axis=-1), 1e-12)
+    distances = np.empty(len(points))
+    chunk = 4096  # points at a time, bounds the size of the temporaries
+    for start in range(0, len(points), chunk):
+        p = points[start:start + chunk, None, :]
+        u = np.clip(((p - a) * e).sum(axis=-1) / length2, 0, 1)
+        closest = a + u[..., None] * e
+        distances[start:start + chunk] = np.sqrt(((p - closest) ** 2).sum(axis=-1)).min(axis=-1)
+    return distances
+
+
+class Planner:
+    """
+    map -- the map, in map units
+    config -- the PLANNER setting:
+        GOAL -- position to plan to, in map units
+        RESOLUTION -- map units per cell
+        RADIUS -- clearance in map units a cell needs to be driven through
+        LOOKAHEAD -- cells between the bot and its next waypoint
+        REPLAN_RANGE -- map units around the bot obstacles of the occupancy grid are taken from
+        EXPANSIONS -- cells a search expands at most
+        CACHE_DIR -- folder the grids are cached in
+    """
+
+    def __init__(self, map, config):
+        self.resolution = config.get('RESOLUTION', RESOLUTION)
+        self.radius = config.get('RADIUS', RADIUS)
+        self.lookahead = config.get('LOOKAHEAD', LOOKAHEAD)
+        self.replan_range = config.get('REPLAN_RANGE', REPLAN_RANGE)
+        self.expansions = config.get('EXPANSIONS', EXPANSIONS)
+
+        segments = raycast.load_segments(map)
+        points = segments.reshape(-1, 2)
+        self.origin = points.min(axis=0)
+        self.shape = tuple(int(n) for n in np.ceil((points.max(axis=0) - self.origin) / self.resolution))
+        self.goal = self.cell(config['GOAL'])
+        if self.goal is None:
+            raise ValueError('GOAL {} is outside the map'.format(config['GOAL']))
+
+        cache_dir = config.get('CACHE_DIR')
+        key = hashlib.sha1(segments.tobytes()).hexdigest()
+        self.clearance = self.cached(cache_dir, 'clearance-{}-{}.npy'.format(key, self.resolution),
+                                     lambda: self.distance_transform(segments))
+        self.static_free = self.clearance >= self.radius
+        if not self.static_free[self.goal]:
+            # no path could lead into it, every cell would be unreachable
+            raise ValueError('GOAL {} is closer than RADIUS {} to a wall'.format(config['GOAL'], self.radius))
+        self.blocked = np.zeros(self.shape, dtype=bool)  # by obstacles the map does not have
+
+        # cells within RADIUS of a cell, to widen obstacles by
+        reach = int(math.ceil(self.radius / self.resolution))
+        offsets = np.argwhere(np.ones((2 * reach + 1, 2 * reach + 1), dtype=bool)) - reach
+        self.disk = offsets[np.hypot(offsets[:, 0], offsets[:, 1]) * self.resolution <= self.radius]
+
+        cost_name = 'cost-{}-{}-{}-{}-{}.npy'.format(key, self.resolution, self.radius, *self.goal)
+        self.cost = self.cached(cache_dir, cost_name, self.plan)
+        self.cost_rows = self.cost.tolist()
+        self.blocked_cells = set()
+        self.step_cache = {}
+
+        # the path of the last search, and the length left from every cell of it
+        self.path = []
+        self.index = {}
+        self.remaining = []
+        self.searched_from = None
+        self.complete = False  # whether the path reaches the goal
+        self.expanded = 0  # cells expanded by the last search
+
+    @staticmethod
+    def cached(cache_dir, name, compute):
+        if cache_dir is None:
+            return compute()
+        path = os.path.join(cache_dir, name)
+        try:
+            return np.load(path)
+        except (OSError, ValueError):
+            pass
+        value = compute()
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(path + '.tmp', 'wb') as cache_file:
+            np.save(cache_file, value)
+        os.replace(path + '.tmp', path)
+        return value
+
+    def cell(self, position):
+        """
+        Returns the cell of a position in map units, None outside the grid.
+        """
+        i, j = np.floor((np.asarray(position, dtype=np.float64) - self.origin) / self.resolution).astype(int)
+        if 0 <= i < self.shape[0] and 0 <= j < self.shape[1]:
+            return int(i), int(j)
+        return None
+
+    def centre(self, cell):
+        return [float(v) for v in self.origin + (np.asarray(cell) + 0.5) * self.resolution]
+
+    def distance_transform(self, segments):
+        """
+        Returns the distance of the centre of every cell to the nearest wall.
+        """
+        ij = np.stack(np.meshgrid(np.arange(self.shape[0]), np.arange(self.shape[1]), indexing='ij'),
+                      axis=-1).reshape(-1, 2)
+        centres = self.origin + (ij + 0.5) * self.resolution
+        return segment_distance(segments, centres).reshape(self.shape)
+
+    def enters(self, i, j, ni, nj):
+        """
+        Returns whether a path to the goal may come from cell ni, nj through cell i, j: free
+        cells lead on to free cells, and cells closer than RADIUS to a wall lead to a neighbour
+        at least as far from it, so a bot that got too close finds its way back out.
+        """
+        if not (0 <= ni < self.shape[0] and 0 <= nj < self.shape[1]) or self.blocked[ni, nj]:
+            return False
+        if self.static_free[ni, nj]:
+            return True
+        return self.clearance[ni, nj] <= self.clearance[i, j] and not self.blocked[i, j]
+
+    def plan(self):
+        """
+        Plans every cell from scratch, returns cost.
+        """
+        self.cost = np.full(self.shape, np.inf)
+        self.cost[self.goal] = 0.0
+        queue = [(0.0, self.goal)]
+        cost = self.cost
+        while queue:
+            c, (i, j) = heapq.heappop(queue)
+            if c > cost[i, j]:
+                continue
+            for (di, dj), step in zip(NEIGHBOURS, STEPS):
+                ni, nj = i + di, j + dj
+                if self.enters(i, j, ni, nj) and c + step < cost[ni, nj]:
+                    cost[ni, nj] = c + step
+                    heapq.heappush(queue, (c + step, (ni, nj)))
+        return self.cost
+
+    def steps(self, cell):
+        """
+        Returns the (neighbour, length) of every step a path from cell may take towards the
+        goal while nothing but the map is in the way, computed on first use.
+        """
+        steps = self.step_cache.get(cell)
+        if steps is None:
+            i, j = cell
+            free = self.static_free[i, j]
+            steps = []
+            for (di, dj), step in zip(NEIGHBOURS, STEPS):
+                ni, nj = i + di, j + dj
+                if 0 <= ni < self.shape[0] and 0 <= nj < self.shape[1] \
+                        and (free or self.clearance[i, j] <= self.clearance[ni, nj]) \
+                        and self.cost_rows[ni][nj] < math.inf:
+                    steps.append(((ni, nj), step))
+            self.step_cache[cell] = steps
+        return steps
+
+    def search(self, start):
+        """
+        Searches the path from cell start to the goal around blocked with A*, expanding at most
+        EXPANSIONS cells before settling for the way to the most promising one.
+        """
+        # python lists and sets, numpy is slow a cell at a time
+        cost = self.cost_rows
+        blocked = self.blocked_cells
+        g = {start: 0.0}
+        came = {start: None}
+        closed = set()
+        queue = []
+        if cost[start[0]][start[1]] < math.inf and start not in blocked:
+            queue.append((cost[start[0]][start[1]], 0.0, start))
+        expanded = 0
+        end = None
+        while queue:
+            # deeper cells first among equally good ones, so the search follows cost down
+            _, depth, cell = heapq.heappop(queue)
+            if cell in closed:
+                continue
+            if cell == self.goal or expanded >= self.expansions:
+                end = cell
+                break
+            closed.add(cell)
+            expanded += 1
+            for next_cell, step in self.steps(cell):
+                # a path never leads on through a blocked cell, so it is not entered either
+                reached = step - depth
+                if reached < g.get(next_cell, math.inf) and next_cell not in blocked:
+                    g[next_cell] = reached
+                    came[next_cell] = cell
+                    # rounded so paths of the same length tie instead of differing in the last bits
+                    f = round(reached + cost[next_cell[0]][next_cell[1]], 9)
+                    heapq.heappush(queue, (f, -reached, next_cell))
+        self.expanded = expanded
+
+        self.searched_from = start
+        self.complete = end == self.goal
+        self.path = []
+        cell = end
+        while cell is not None:
+            self.path.append(cell)
+            cell = came[cell]
+        self.path.reverse()
+        self.index = {cell: k for k, cell in enumerate(self.path)}
+        if self.path:
+            # short of the goal, what is left is at least the cost of the last cell
+            total = g[end] + cost[end[0]][end[1]]
+            self.remaining = [total - g[cell] for cell in self.path]
+
+    def route(self, cell):
+        """
+        Searches again unless the last path leads from cell to the goal or was searched from it.
+        """
+        if cell != self.searched_from and not (self.complete and cell in self.index):
+            self.search(cell)
+
+    def update_obstacles(self, blocked):
+        """
+        Replans for blocked, a bool array of the shape of the grid of the cells obstacles the
+        map does not have block now. It replaces the one of the previous call.
+        """
+        blocked = blocked.copy()
+        blocked[self.goal] = False
+        if (blocked == self.blocked).all():
+            return
+        freed = (self.blocked & ~blocked).any()
+        self.blocked = blocked
+        self.blocked_cells = set(map(tuple, np.argwhere(blocked).tolist()))
+        if not freed and self.complete and not any(cell in self.blocked_cells for cell in self.path):
+            # obstacles off the path make no other path shorter
+            return
+        self.searched_from = None
+        self.complete = False
+        self.index = {}
+
+    def obstacles_from_grid(self, grid, position, reach):
+        """
+        Returns the cells blocked by what grid, an occupancy.OccupancyGrid, has occupied within
+        reach map units of position and map.json does not, widened by RADIUS.
+        """
+        blocked = np.zeros(self.shape, dtype=bool)
+        cells_per_unit = grid.scale / grid.resolution
+        centre = grid.cells(position)
+        span = int(math.ceil(reach * cells_per_unit))
+        lower = centre - span
+        occupied = np.argwhere(grid.window(lower, centre + span) > occupancy.OCCUPIED)
+        if len(occupied) == 0:
+            return blocked
+
+        cells = np.floor(((occupied + lower + 0.5) / cells_per_unit - self.origin)
+                         / self.resolution).astype(np.intp)
+        cells = cells[np.all((cells >= 0) & (cells < self.shape), axis=1)]
+        # walls of the map are already planned around
+        near_wall = self.resolution + 1.0 / cells_per_unit
+        cells = cells[self.clearance[cells[:, 0], cells[:, 1]] > near_wall]
+
+        cells = (cells[:, None, :] + self.disk[None, :, :]).reshape(-1, 2)
+        cells = cells[np.all((cells >= 0) & (cells < self.shape), axis=1)]
+        blocked[cells[:, 0], cells[:, 1]] = True
+        return blocked
+
+    def replan(self, grid, position):
+        """
+        Replans around the obstacles grid has within REPLAN_RANGE of position.
+        """
+        self.update_obstacles(self.obstacles_from_grid(grid, position, self.replan_range))
+        cell = self.cell(position)
+        if cell is not None:
+            self.route(cell)
+
+    def next_waypoint(self, position):
+        """
+        Returns the position LOOKAHEAD cells further along the path to the goal, in map units,
+        or None if no path leads there from position.
+        """
+        cell = self.cell(position)
+        if cell is None:
+            return None
+        self.route(cell)
+        if cell not in self.index:
+            return None
+        return self.centre(self.path[min(self.index[cell] + self.lookahead, len(self.path) - 1)])
+
+    def distance_to_goal(self, position):
+        """
+        Returns the length of the path to the goal in map units, inf if there is none. While
+        the search is short of the goal it is a lower bound.
+        """
+        cell = self.cell(position)
+        if cell is None:
+            return math.inf
+        self.route(cell)
+        if cell not in self.index:
+            return math.inf
+        return float(self.remaining[self.index[cell]] * self.resolution)
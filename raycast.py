@@ -0,0 +1,60 @@
+import math
+import numpy as np
+
+# lidar sample pointing to the front of the bot, samples go clockwise from the back
+FORWARD_INDEX = 180
+
+
+def load_segments(map):
+    """
+    Returns the wall segments of a map as an array of shape (N, 2, 2).
+    """
+    return np.asarray(map, dtype=np.float64).reshape(-1, 2, 2)
+
+
+def heading(direction):
+    """
+    Returns the angle in radians of a direction vector.
+    """
+    return math.atan2(direction[1], direction[0])
+
+
+def beam_angles(theta, size=360):
+    """
+    Returns the world angle of every lidar sample for a bot heading of theta radians.
+    """
+    return theta + np.radians((FORWARD_INDEX - np.arange(size)) * 360.0 / size)
+
+
+def cast(segments, origins, angles, max_range=np.inf):
+    """
+    Casts rays against wall segments.
+
+    segments -- array of shape (S, 2, 2)
+    origins -- array of ray origins of shape (..., 2)
+    angles -- array of ray angles in radians, broadcast against origins[..., 0]
+
+    Returns the distance along every ray to the nearest segment, max_range where nothing is hit.
+    """
+    origins = np.asarray(origins, dtype=np.float64)
+    ox, oy, angles = np.broadcast_arrays(origins[..., 0], origins[..., 1], angles)
+    ox = ox[..., None]
+    oy = oy[..., None]
+    dx = np.cos(angles)[..., None]
+    dy = np.sin(angles)[..., None]
+
+    ax = segments[:, 0, 0]
+    ay = segments[:, 0, 1]
+    ex = segments[:, 1, 0] - ax
+    ey = segments[:, 1, 1] - ay
+
+    # solve origin + t * d = a + u * e for every ray and segment
+    denom = dx * ey - dy * ex
+    wx = ax - ox
+    wy = ay - oy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = (wx * ey - wy * ex) / denom
+        u = (wx * dy - wy * dx) / denom
+    hit = (denom != 0) & (t >= 0) & (u >= 0) & (u <= 1)
+
+    return np.where(hit, t, max_range).min(axis=-1, initial=max_range)
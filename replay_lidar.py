@@ -0,0 +1,78 @@
+import itertools
+import time
+import ciNeuroBotLidar
+from capture import read_capture
+
+
+class Lidar(ciNeuroBotLidar.Lidar):
+    """
+    Replays a capture file through the ciNeuroBotLidar decoder instead of reading the serial port.
+
+    LIDAR_CONFIG settings:
+        FILE -- path of the capture file
+        SPEED -- replay speed, 1 is the recorded speed, 2 twice as fast and 0 as fast as possible
+        LOOP -- start over at the end of the capture instead of stopping
+
+    At the end of a capture that does not loop, get_image and latest raise scan.EndOfScans once
+    the last revolution was handed out. As fast as possible only means as fast as the revolutions
+    are taken: the next record is only decoded once the latest revolution was handed out, so none
+    is overwritten unread.
+    """
+
+    def open(self, config):
+        self.path = config['FILE']
+        self.speed = config.get('SPEED', 1.0)
+        self.loop = config.get('LOOP', False)
+        records = read_capture(self.path)
+        # read the first record now, so a file that is not a capture fails at startup, not in the reader
+        first = next(records, None)
+        self.records = itertools.chain([first] if first is not None else [], records)
+        self.read_chunk = self.read_record
+
+        # recorded times are replayed relative to the start of the replay
+        self.first_stamp = None
+        self.offset = 0.0
+        self.last_stamp = 0.0
+
+    def read_record(self):
+        """
+        Returns the next record of the capture, waiting until it is due at the replay speed.
+        """
+        record = next(self.records, None)
+        if record is None and self.loop and self.first_stamp is not None:
+            # start over, unless the pass that just ended had no record either
+            self.records = read_capture(self.path)
+            self.offset = self.last_stamp - self.first_stamp
+            self.first_stamp = None
+            record = next(self.records, None)
+        if record is None:
+            self.quit = True
+            self.store.close()
+            if self.watchdog is not None:
+                self.watchdog.done('lidar')
+            return time.time(), b''
+        stamp, data = record
+
+        if self.first_stamp is None:
+            self.first_stamp = stamp - self.offset
+        self.last_stamp = stamp
+
+        elapsed = stamp - self.first_stamp
+        if self.speed > 0:
+            delay = self.started + elapsed / self.speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            self.wait_for_reader()
+
+        return self.started + elapsed, data
+
+    def wait_for_reader(self):
+        """
+        Waits until the latest revolution was handed out or the replay is stopped.
+        """
+        if self.watchdog is not None:
+            # the replay is held back by the consumer, not stalled
+            self.watchdog.done('lidar')
+        while not self.quit and not self.store.wait_delivered(ciNeuroBotLidar.SELECT_TIMEOUT):
+            pass
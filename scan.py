@@ -0,0 +1,269 @@
+import threading
+from functools import cached_property
+import numpy as np
+
+# flags carried in byte 1 of every Neato reading
+FLAG_INVALID = 0x80
+FLAG_WEAK = 0x40
+
+# closer samples are parts of the robot
+MIN_DIST = 150
+
+# angle in degrees of every sample and its trig, computed once
+ANGLES = np.arange(360)
+COS = np.cos(np.radians(ANGLES))
+SIN = np.sin(np.radians(ANGLES))
+
+
+class EndOfScans(Exception):
+    """
+    Raised to a reader asking for a revolution once the lidar closed and every revolution was
+    handed out.
+    """
+
+
+class ScanFrame:
+    """
+    One complete lidar revolution.
+
+    Behaves like the image, a sequence of [distance, quality] rows, so existing consumers keep
+    working, and carries the sequence number and capture time of the revolution.
+
+    stamps -- capture time of every sample, 0 for samples that were never received
+    flags -- FLAG_INVALID and FLAG_WEAK of every sample
+    rpm -- average rotation speed over the revolution
+
+    Cartesian coordinates, validity masks and filtered subsets are computed on first use and
+    cached, so every consumer of a revolution shares them.
+    """
+
+    def __init__(self, image, seq=0, stamp=0.0, stamps=None, flags=None, rpm=0.0):
+        self.image = image
+        self.seq = seq
+        self.stamp = stamp
+        if stamps is None:
+            stamps = np.full(len(image), stamp)
+        if flags is None:
+            flags = np.zeros(len(image), dtype=np.uint8)
+        self.stamps = stamps
+        self.flags = flags
+        self.rpm = rpm
+        self._filtered = {}
+
+    @property
+    def angles(self):
+        return ANGLES[:len(self.image)]
+
+    @property
+    def distances(self):
+        return self.image[:, 0]
+
+    @property
+    def qualities(self):
+        return self.image[:, 1]
+
+    @cached_property
+    def points(self):
+        """
+        [x, z] coordinates of every sample, x along angle 0 and z along angle 90.
+        """
+        size = len(self.image)
+        return np.column_stack((COS[:size] * self.distances, SIN[:size] * self.distances))
+
+    @cached_property
+    def valid(self):
+        """
+        Mask of the samples holding a distance.
+        """
+        return (self.distances > 0) & ((self.flags & FLAG_INVALID) == 0)
+
+    def filtered(self, min_dist=MIN_DIST):
+        """
+        Returns (angles, image, points) of the samples that are off the robot and read correctly.
+        """
+        if min_dist not in self._filtered:
+            keep = (self.distances >= min_dist) & (self.qualities > 0)
+            self._filtered[min_dist] = (self.angles[keep], self.image[keep], self.points[keep])
+        return self._filtered[min_dist]
+
+    def __len__(self):
+        return len(self.image)
+
+    def __getitem__(self, item):
+        return self.image[item]
+
+    def __iter__(self):
+        return iter(self.image)
+
+    def __array__(self, dtype=None, copy=None):
+        if dtype is None and not copy:
+            return self.image
+        return np.array(self.image, dtype=dtype)
+
+
+class ScanStore:
+    """
+    Fixed buffers holding lidar revolutions.
+
+    The reader thread writes samples into the back buffer and swaps it to the front once a
+    revolution is complete, so readers only ever see whole revolutions. Readers get a copy of
+    the front buffer, taken while the reader thread cannot swap, so a frame never changes
+    however long it is kept.
+    """
+
+    def __init__(self, size=360, depth=3):
+        self.size = size
+        self.depth = depth
+
+        self.image = np.zeros((depth, size, 2), dtype=np.int32)  # distance, quality
+        self.flags = np.zeros((depth, size), dtype=np.uint8)
+        self.stamps = np.zeros((depth, size), dtype=np.float64)
+        self.rpms = np.zeros((depth, size), dtype=np.float32)
+
+        self.front = None
+        self.back = 0
+        self.last_angle = -1
+
+        self.seq = 0  # sequence number of the front buffer, 0 until the first revolution
+        self.seqs = np.zeros(depth, dtype=np.int64)
+        self.delivered = 0  # highest sequence number handed to a reader
+        self.dropped = 0  # revolutions skipped by readers asking for everything after a sequence
+        self.overwritten = 0  # revolutions replaced before any reader got them
+        self.closed = False  # set by close, no revolution follows
+
+        self.lock = threading.Lock()
+        self.filled = threading.Condition(self.lock)
+        self.clear(self.back)
+
+    def clear(self, buf):
+        """
+        Marks every sample of a buffer as invalid until the reader fills it.
+        """
+        self.image[buf] = 0
+        self.flags[buf] = FLAG_INVALID
+        self.stamps[buf] = 0
+        self.rpms[buf] = 0
+
+    def write(self, angles, dists, quals, flags, stamps, rpms=0.0):
+        """
+        Stores decoded samples, swapping buffers whenever a revolution completes.
+
+        angles -- int array of sample angles in the order they arrived
+        dists, quals, flags -- arrays of the same length as angles
+        stamps -- capture time of the samples, a float or an array like angles
+        rpms -- rotation speed when the samples were taken, a float or an array like angles
+        """
+        stamps = np.broadcast_to(stamps, angles.shape)
+        rpms = np.broadcast_to(rpms, angles.shape)
+
+        # a revolution ends after angle size - 1, or when the angles wrap because it was missed
+        previous = np.concatenate(([self.last_angle], angles[:-1]))
+        wraps = np.flatnonzero(angles <= previous)
+
+        start = 0
+        for end in wraps:
+            if end > start:
+                self._fill(angles[start:end], dists[start:end], quals[start:end],
+                           flags[start:end], stamps[start:end], rpms[start:end])
+            if self.last_angle >= 0:
+                self.swap()
+            start = end
+
+        if start < len(angles):
+            self._fill(angles[start:], dists[start:], quals[start:], flags[start:], stamps[start:],
+                       rpms[start:])
+        if self.last_angle == self.size - 1:
+            self.swap()
+
+    def _fill(self, angles, dists, quals, flags, stamps, rpms):
+        image = self.image[self.back]
+        image[angles, 0] = dists
+        image[angles, 1] = quals
+        self.flags[self.back, angles] = flags
+        self.stamps[self.back, angles] = stamps
+        self.rpms[self.back, angles] = rpms
+        self.last_angle = int(angles[-1])
+
+    def swap(self):
+        """
+        Publishes the back buffer as the latest complete revolution.
+        """
+        with self.filled:
+            if self.seq > self.delivered:
+                self.overwritten += 1
+            self.seq += 1
+            self.seqs[self.back] = self.seq
+            self.front = self.back
+            self.back = (self.back + 1) % self.depth
+            self.last_angle = -1
+            self.filled.notify_all()
+        self.clear(self.back)
+
+    def close(self):
+        """
+        Marks the end of the revolutions, readers waiting for a newer one get EndOfScans.
+        """
+        with self.filled:
+            self.closed = True
+            self.filled.notify_all()
+
+    def wait_delivered(self, timeout=None):
+        """
+        Waits until a reader got the latest revolution, returns False if timeout seconds pass
+        first.
+        """
+        with self.filled:
+            return self.filled.wait_for(lambda: self.delivered >= self.seq, timeout)
+
+    def _frame(self):
+        # copied under the lock, the buffer is written again depth - 1 revolutions later
+        image = self.image[self.front].copy()
+        stamps = self.stamps[self.front].copy()
+        flags = self.flags[self.front].copy()
+        for array in (image, stamps, flags):
+            array.flags.writeable = False
+
+        rpms = self.rpms[self.front]
+        received = rpms > 0
+        rpm = float(rpms[received].mean()) if received.any() else 0.0
+
+        self.delivered = max(self.delivered, self.seq)
+        self.filled.notify_all()
+        return ScanFrame(image, self.seq, stamps.max(), stamps, flags, rpm)
+
+    def get(self, after_seq=None, timeout=None):
+        """
+        Returns the latest complete revolution as a ScanFrame.
+
+        after_seq -- only return a revolution with a higher sequence number, waiting for it if
+                     needed. Without it any revolution will do.
+        timeout -- seconds to wait before giving up and returning None, None waits forever.
+
+        Raises EndOfScans instead of waiting once the store is closed and has nothing newer.
+        The frame holds a read-only copy of the revolution, it may be kept as long as needed.
+        """
+        if after_seq is None:
+            after_seq = 0
+
+        with self.filled:
+            if not self.filled.wait_for(lambda: self.seq > after_seq or self.closed, timeout):
+                return None
+            if self.seq <= after_seq:
+                raise EndOfScans()
+
+            if after_seq > 0 and self.seq > after_seq + 1:
+                self.dropped += self.seq - after_seq - 1
+            return self._frame()
+
+    def latest(self):
+        """
+        Returns the latest complete revolution without waiting, or None if there is none yet.
+
+        Raises EndOfScans once the store is closed and the latest revolution was handed out.
+        """
+        with self.filled:
+            if self.closed and self.delivered >= self.seq:
+                raise EndOfScans()
+            if self.front is None:
+                return None
+            return self._frame()
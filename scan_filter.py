@@ -0,0 +1,184 @@
+"""
+    Scan filter
+    ===========
+
+    Smooths the revolutions of the lidar over time and fills the readings it could not take,
+    between the lidar and AI.decide.
+
+    The last DEPTH revolutions are kept in a ring buffer. A sample is measured when its
+    distance is not 0 and its signal strength at least MIN_QUALITY, and the filtered distance
+    of every angle is, in MODE:
+
+        median -- the lower median of the measured samples of the angle in the ring buffer
+        ema -- an exponential moving average with ALPHA, weighted down for weak readings
+
+    A reading more than JUMP mm closer than the filtered distance is taken as it is, so a new
+    obstacle shows up in the revolution it is first seen in while a reading that jumps farther
+    has to be seen again first.
+
+    Angles measured in none of the buffered revolutions are filled from the nearest measured
+    neighbours up to GAP samples away, taking the closer of the two, and are set to UNKNOWN
+    otherwise, by default the farthest distance the lidar measures so a longer gap is no
+    obstacle to the AI. confidence is 0 for those, AIs telling them apart from far readings
+    read it; it falls with the age of held readings and is the quality weight for fresh ones.
+
+    When the heading of the bot is given with every revolution, the history is turned with the
+    bot, so it stays aligned while the bot turns; moving straight is not corrected for.
+    """
+
+import numpy as np
+
+DEPTH = 5  # revolutions kept
+MODE = 'median'
+ALPHA = 0.5  # weight of a full quality reading in the moving average
+MIN_QUALITY = 1  # signal strength below which a reading is not measured
+QUALITY = 100.0  # signal strength from which on a reading counts fully
+MIN_WEIGHT = 0.3  # weight of the weakest measured reading
+JUMP = 150.0  # mm a reading may come closer before it is taken as it is
+GAP = 3  # samples a gap is filled across from its neighbours
+UNKNOWN = 6000.0  # mm, distance of angles neither measured, held nor filled, the lidar's range
+HELD = 0.5  # confidence of a reading held from the previous revolution
+FILLED = 0.25  # confidence of a reading filled from its neighbours
+
+
+class ScanFilter:
+    """
+    config -- optional dict, the SCAN_FILTER setting:
+        DEPTH -- revolutions kept in the ring buffer
+        MODE -- 'median' or 'ema'
+        ALPHA -- weight of a new full quality reading in 'ema' mode
+        MIN_QUALITY -- signal strength below which a reading is not measured
+        JUMP -- mm a reading may come closer before it is taken as it is
+        GAP -- samples a gap is filled across from its neighbours
+        UNKNOWN -- distance of angles neither measured, held nor filled
+    size -- samples per revolution
+    """
+
+    def __init__(self, config=None, size=360):
+        config = config or {}
+        self.depth = config.get('DEPTH', DEPTH)
+        self.mode = config.get('MODE', MODE)
+        if self.mode not in ('median', 'ema'):
+            raise ValueError('unknown MODE {}'.format(self.mode))
+        self.alpha = config.get('ALPHA', ALPHA)
+        self.min_quality = config.get('MIN_QUALITY', MIN_QUALITY)
+        self.jump = config.get('JUMP', JUMP)
+        self.gap = config.get('GAP', GAP)
+        self.unknown = config.get('UNKNOWN', UNKNOWN)
+        self.size = size
+
+        self.ring = np.zeros((self.depth, size))
+        self.measured = np.zeros((self.depth, size), dtype=bool)
+        self.headings = np.zeros(self.depth)  # degrees, heading of every buffered revolution
+        self.count = 0  # revolutions seen
+        self.ema = np.zeros(size)
+        self.age = np.full(size, self.depth)  # revolutions since the ema of an angle was measured
+        self.heading = 0.0
+
+        self.angles = np.arange(size)
+        self.filtered = np.zeros(size)
+        self.confidence = np.zeros(size)
+
+    def update(self, distances, qualities=None, heading=None):
+        """
+        Adds a revolution and returns its filtered distances, setting confidence.
+
+        distances -- the distances of the revolution in mm, 0 where invalid
+        qualities -- optional signal strengths of the readings
+        heading -- optional counter-clockwise heading of the bot in radians
+        """
+        distances = np.asarray(distances, dtype=np.float64)
+        measured = distances > 0
+        weight = np.ones(self.size)
+        if qualities is not None:
+            qualities = np.asarray(qualities, dtype=np.float64)
+            measured &= qualities >= self.min_quality
+            weight = MIN_WEIGHT + (1.0 - MIN_WEIGHT) * np.minimum(qualities / QUALITY, 1.0)
+
+        # a sample of a revolution taken turned by d degrees less lies d samples further back
+        turned = 0.0 if heading is None else np.degrees(heading) - self.heading
+        if heading is not None:
+            self.heading = np.degrees(heading)
+
+        slot = self.count % self.depth
+        self.ring[slot] = distances
+        self.measured[slot] = measured
+        self.headings[slot] = self.heading
+        self.count += 1
+
+        if self.mode == 'median':
+            value, age = self.median()
+        else:
+            value, age = self.moving_average(distances, measured, weight, turned)
+
+        # closer readings are believed at once
+        closer = measured & (distances < value - self.jump)
+        value = np.where(closer, distances, value)
+        age = np.where(closer, 0, age)
+
+        held = age < self.depth
+        confidence = np.where(measured, weight, np.where(held, HELD * (1.0 - age / self.depth), 0.0))
+        value, confidence = self.fill(value, held, confidence)
+
+        self.filtered = value
+        self.confidence = confidence
+        return value
+
+    def median(self):
+        """
+        Returns the lower median of the measured samples of every angle and the revolutions
+        since the angle was last measured.
+        """
+        count = min(self.count, self.depth)
+        newest = (self.count - 1) % self.depth
+        slots = (newest - np.arange(count)) % self.depth  # newest first
+        shifts = np.rint(self.headings[newest] - self.headings[slots]).astype(np.intp)
+        index = (self.angles[None, :] - shifts[:, None]) % self.size
+        ring = self.ring[slots[:, None], index]
+        measured = self.measured[slots[:, None], index]
+
+        ordered = np.sort(np.where(measured, ring, np.inf), axis=0)
+        seen = measured.sum(axis=0)
+        value = ordered[np.maximum(seen - 1, 0) // 2, self.angles]
+        age = np.where(seen > 0, np.argmax(measured, axis=0), self.depth)
+        return value, age
+
+    def moving_average(self, distances, measured, weight, turned):
+        shift = int(np.rint(turned))
+        if shift:
+            self.ema = np.roll(self.ema, shift)
+            self.age = np.roll(self.age, shift)
+
+        known = self.age < self.depth
+        alpha = self.alpha * weight
+        average = self.ema + alpha * (distances - self.ema)
+        self.ema = np.where(measured, np.where(known, average, distances), self.ema)
+        self.age = np.where(measured, 0, np.minimum(self.age + 1, self.depth))
+        return self.ema.copy(), self.age.copy()
+
+    def fill(self, value, known, confidence):
+        """
+        Fills the angles not known from their nearest known neighbours up to GAP samples away.
+        """
+        if known.all():
+            return value, confidence
+        if not known.any():
+            return np.full(self.size, self.unknown), confidence
+
+        # index of the nearest known sample at or before and at or after every angle, over the
+        # revolution laid out three times so gaps wrap around
+        tripled = np.arange(3 * self.size)
+        known3 = np.tile(known, 3)
+        before = np.maximum.accumulate(np.where(known3, tripled, -self.size))[self.size:2 * self.size]
+        after = np.minimum.accumulate(np.where(known3, tripled, 4 * self.size)[::-1])[::-1]
+        after = after[self.size:2 * self.size]
+
+        middle = self.angles + self.size
+        left = np.where(middle - before <= self.gap, value[before % self.size], np.inf)
+        right = np.where(after - middle <= self.gap, value[after % self.size], np.inf)
+        nearest = np.minimum(left, right)
+
+        filled = ~known & np.isfinite(nearest)
+        value = np.where(known, value, np.where(filled, nearest, self.unknown))
+        confidence = np.where(filled, FILLED, confidence)
+        return value, confidence
@@ -0,0 +1,96 @@
+import time
+from timing import Histogram
+
+
+class Task:
+    """
+    A function run every period seconds, with its timing statistics.
+    """
+
+    def __init__(self, name, period, func):
+        self.name = name
+        self.period = period
+        self.func = func
+        self.deadline = 0.0
+
+        self.runs = 0
+        self.overruns = 0  # runs that finished after the next deadline
+        self.skipped = 0  # ticks dropped because the task was too late to catch up
+        self.cycle_time = Histogram()
+        self.jitter = Histogram()
+
+    def snapshot(self):
+        return {
+            'period': self.period,
+            'runs': self.runs,
+            'overruns': self.overruns,
+            'skipped': self.skipped,
+            'cycle_time': self.cycle_time.snapshot(),
+            'jitter': self.jitter.snapshot(),
+        }
+
+
+class Scheduler:
+    """
+    Runs tasks at fixed rates from a single thread.
+
+    A task that falls behind by one or more whole periods skips those ticks instead of running
+    them back to back, so stale work is never queued up.
+
+    on_tick -- optional function called after every task run, e.g. to feed a watchdog
+    """
+
+    def __init__(self, on_tick=None):
+        self.tasks = []
+        self.on_tick = on_tick
+        self.running = False
+
+    def add(self, name, rate, func):
+        """
+        Runs func rate times per second.
+        """
+        task = Task(name, 1.0 / rate, func)
+        self.tasks.append(task)
+        return task
+
+    def run(self):
+        """
+        Runs the tasks until stop is called.
+        """
+        self.running = True
+        start = time.monotonic()
+        for task in self.tasks:
+            task.deadline = start
+
+        while self.running:
+            task = min(self.tasks, key=lambda t: t.deadline)
+            delay = task.deadline - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            begin = time.monotonic()
+            late = begin - task.deadline
+            task.jitter.add(late)
+            if late >= task.period:
+                # too late to catch up, skip to the next tick still ahead
+                missed = int(late // task.period)
+                task.skipped += missed
+                task.deadline += missed * task.period
+
+            task.func()
+            end = time.monotonic()
+
+            task.runs += 1
+            task.cycle_time.add(end - begin)
+            task.deadline += task.period
+            if end > task.deadline:
+                task.overruns += 1
+
+            if self.on_tick is not None:
+                self.on_tick()
+
+    def stop(self):
+        self.running = False
+
+    def stats(self):
+        return {task.name: task.snapshot() for task in self.tasks}
@@ -0,0 +1,126 @@
+"""
+    Sector statistics
+    =================
+
+    Mean, min, max and number of valid samples of any angular window of a revolution, built
+    once per revolution and answered in constant time per window.
+
+    The revolution is treated as circular: a window may start anywhere and run past the last
+    sample into the first ones. Sums and counts come from prefix sums over the revolution laid
+    out twice, min and max from sparse tables over the same, so every query is a handful of
+    lookups whatever the size of the window, which may be 0 to the size of the revolution
+    long. start and length may also be arrays, to evaluate many windows, e.g. candidate
+    headings, in one call.
+
+        stats = SectorStats(image)
+        stats.mean(135, 90)  # the front quarter
+        stats.min(np.arange(360), 30)  # every 30 degree window
+    """
+
+import numpy as np
+
+_log_tables = {}
+
+
+def log_table(size):
+    """
+    Returns floor(log2(n)) for every n from 0 to size, 0 for 0 and 1, shared between revolutions.
+    """
+    if size not in _log_tables:
+        table = np.zeros(size + 1, dtype=np.intp)
+        table[2:] = np.floor(np.log2(np.arange(2, size + 1))).astype(np.intp)
+        _log_tables[size] = table
+    return _log_tables[size]
+
+
+class SectorStats:
+    """
+    distances -- the distances of a revolution
+    valid -- optional mask of the samples to count, all of them by default
+    """
+
+    def __init__(self, distances, valid=None):
+        distances = np.asarray(distances, dtype=np.float64)
+        self.size = len(distances)
+        twice = np.concatenate([distances, distances])
+        if valid is None:
+            self.valid = None
+            self.counts = np.arange(len(twice) + 1)
+        else:
+            self.valid = np.concatenate([valid, valid])
+            self.counts = np.concatenate([[0], np.cumsum(self.valid)])
+            twice = np.where(self.valid, twice, 0.0)
+        self.twice = twice
+        self.sums = np.concatenate([[0.0], np.cumsum(twice)])
+
+        # min and max sparse tables are only built once they are asked for
+        self.mins = None
+        self.maxs = None
+        self.log = log_table(self.size)
+
+    def sparse_table(self, reduce, empty):
+        """
+        Returns a table whose level k holds the reduction of the 2 ** k samples starting at
+        every index.
+        """
+        levels = int(self.log[self.size]) + 1
+        table = np.empty((levels, len(self.twice)))
+        table[0] = self.twice if self.valid is None else np.where(self.valid, self.twice, empty)
+        for k in range(1, levels):
+            half = 1 << (k - 1)
+            reduce(table[k - 1, :-half], table[k - 1, half:], out=table[k, :-half])
+            table[k, -half:] = table[k - 1, -half:]
+        return table
+
+    def bounds(self, start, length):
+        if isinstance(start, (int, np.integer)) and isinstance(length, (int, np.integer)):
+            if not 0 <= length <= self.size:
+                raise ValueError('window length {} is not between 0 and {}'.format(length, self.size))
+            start = int(start) % self.size
+            return start, start + int(length)
+        length = np.asarray(length)
+        if np.any((length < 0) | (length > self.size)):
+            raise ValueError('window lengths must be between 0 and {}'.format(self.size))
+        start = np.asarray(start) % self.size
+        return start, start + length
+
+    def sum(self, start, length):
+        start, stop = self.bounds(start, length)
+        return self.sums[stop] - self.sums[start]
+
+    def count(self, start, length):
+        """
+        Returns the number of valid samples of the window.
+        """
+        start, stop = self.bounds(start, length)
+        return self.counts[stop] - self.counts[start]
+
+    def mean(self, start, length):
+        """
+        Returns the mean of the valid samples of the window, nan if there are none.
+        """
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return np.divide(self.sum(start, length), self.count(start, length))
+
+    def min(self, start, length):
+        """
+        Returns the smallest valid sample of the window, inf if there are none.
+        """
+        if self.mins is None:
+            self.mins = self.sparse_table(np.minimum, np.inf)
+        start, stop = self.bounds(start, length)
+        k = self.log[stop - start]
+        value = np.minimum(self.mins[k, start], self.mins[k, stop - (1 << k)])
+        # an empty window would read the sample before it
+        return np.where(stop > start, value, np.inf)[()]
+
+    def max(self, start, length):
+        """
+        Returns the largest valid sample of the window, -inf if there are none.
+        """
+        if self.maxs is None:
+            self.maxs = self.sparse_table(np.maximum, -np.inf)
+        start, stop = self.bounds(start, length)
+        k = self.log[stop - start]
+        value = np.maximum(self.maxs[k, start], self.maxs[k, stop - (1 << k)])
+        return np.where(stop > start, value, -np.inf)[()]
@@ -1,5 +1,6 @@
 import numpy as np
 from math import sqrt
+from sectors import SectorStats
 
 class AI:
     def __init__(self):
@@ -17,27 +18,20 @@ class AI:
         angle = 0
 
         # choose left or right, whatever has most distant obstacles
+        stats = SectorStats(image)
         mid = len(image) // 2
-        f = image[3*mid//4:5*mid//4]
-        l = image[:mid]  # left side of the bot
-        r = image[mid:]  # right side of the bot
-        fl = image[mid // 2:mid]  # front left quarter
-        fr = image[mid:mid + mid // 2]  # front right quarter
-        bl = image[:mid // 2]  # back left quarter
-        br = image[mid + mid // 2:]  # back right quarter
+        f = (3*mid//4, 5*mid//4 - 3*mid//4)  # front quarter, as (start, length)
+        fl = (mid // 2, mid - mid // 2)  # front left quarter
+        fr = (mid, mid // 2)  # front right quarter
 
         # evaluate the "volume" of obstacles on the left vs. right and select the direction minimizing the
         # the chance for a collision
-        # if min(fl) * np.average(fl) ** 0.5 > min(fr) * np.average(fr) ** 0.5:
-        d_min = min(f)
-        d_avg = np.average(f)
-        d_max = max(f)
-        print(d_min, d_avg, d_max)
+        d_avg = stats.mean(*f)
 
         if d_avg > 200:
             angle = 0
             speed = .5
-        elif sqrt(min(fl) * np.average(fl)) > sqrt(min(fr) * np.average(fr)):
+        elif sqrt(stats.min(*fl) * stats.mean(*fl)) > sqrt(stats.min(*fr) * stats.mean(*fr)):
             angle = -1
             speed = 0
             message += 'left'
@@ -55,3 +49,25 @@ class AI:
 
         return {'angle': angle, 'speed': speed, 'quote': message}
 
+    def decide_batch(self, bot, images, map):
+        """
+        Same decision as decide for many revolutions at once.
+        :param images: np.array of shape (N, 360), one row of distances per revolution
+        :returns angle: np.array of N clockwise angles
+        :returns speed: np.array of N speeds
+        """
+        images = np.asarray(images)
+        mid = images.shape[1] // 2
+        f = images[:, 3*mid//4:5*mid//4]
+        fl = images[:, mid // 2:mid]
+        fr = images[:, mid:mid + mid // 2]
+
+        d_avg = np.average(f, axis=1)
+        go_left = np.sqrt(fl.min(axis=1) * np.average(fl, axis=1)) > \
+            np.sqrt(fr.min(axis=1) * np.average(fr, axis=1))
+
+        clear = d_avg > 200
+        angle = np.where(clear, 0, np.where(go_left, -1, 1))
+        speed = np.where(clear, .5, 0)
+
+        return {'angle': angle, 'speed': speed}
@@ -0,0 +1,287 @@
+"""
+    Headless simulator
+    ==================
+
+    Drives an unmodified AI module through a map.json world, faster than real time.
+
+    Every step ray casts a 360 sample revolution from the pose of the bot, hands it to
+    AI.decide exactly like LidarBot.process does, and moves the bot for one revolution with
+    the motor values of driver.arcade: both wheels forward drive it straight, their difference
+    turns it. A step that would bring the bot closer than RADIUS to a wall is a collision and
+    the bot stays where it was.
+
+    Episodes run in parallel in a process pool, each reporting collisions, the share of the
+    free space it covered and the decisions per second it reached.
+
+    $ python3 simulator.py --episodes 8 --steps 2000 --noise 5
+    """
+
+import argparse
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import raycast
+from driver import arcade
+from fake_neato import MIN_RANGE, MAX_RANGE
+
+SCALE = 20.0  # mm per map unit
+RPM = 300  # one decision per revolution
+RADIUS = 100.0  # mm
+MAX_SPEED = 500.0  # mm/s at full command
+MAX_TURN_RATE = 3.0  # radians/s at full command
+CELL = 100.0  # mm, size of the coverage grid cells
+SUBSTEPS = 4  # collision checks per revolution
+
+
+def wall_distance(segments, points):
+    """
+    Returns the distance from every point of shape (..., 2) to the nearest segment.
+    """
+    points = np.asarray(points, dtype=np.float64)[..., None, :]
+    a = segments[:, 0]
+    e = segments[:, 1] - a
+    length2 = np.maximum((e ** 2).sum(axis=-1), 1e-12)
+    u = np.clip(((points - a) * e).sum(axis=-1) / length2, 0, 1)
+    closest = a + u[..., None] * e
+    return np.sqrt(((points - closest) ** 2).sum(axis=-1)).min(axis=-1)
+
+
+class SimBot:
+    """
+    The simulated bot, handed to AI.decide in place of LidarBot.
+
+    position and dir are in map units like the START_POS and START_DIR settings.
+    """
+
+    def __init__(self, position, direction, scale=SCALE):
+        self.scale = scale
+        self.xy = np.asarray(position, dtype=np.float64) * scale  # mm
+        self.theta = raycast.heading(direction)
+        self.speed = 0.0
+        self.angle = 0.0
+
+    @property
+    def position(self):
+        return list(self.xy / self.scale)
+
+    @property
+    def dir(self):
+        return [math.cos(self.theta), math.sin(self.theta)]
+
+
+class Simulator:
+    """
+    One episode of an AI in a world.
+
+    map -- the map, in map units
+    config -- optional dict, the SIMULATOR setting:
+        SCALE -- mm per map unit
+        RPM -- lidar revolutions per minute, the bot decides once per revolution
+        RADIUS -- radius of the bot in mm
+        MAX_SPEED -- speed in mm/s at full command
+        MAX_TURN_RATE -- turn rate in radians/s at full command
+        NOISE -- standard deviation of the distance noise in mm
+        CELL -- size of the coverage grid cells in mm
+    """
+
+    def __init__(self, map, position, direction, config=None, seed=None):
+        config = config or {}
+        self.map = map
+        self.scale = config.get('SCALE', SCALE)
+        self.period = 60.0 / config.get('RPM', RPM)
+        self.radius = config.get('RADIUS', RADIUS)
+        self.max_speed = config.get('MAX_SPEED', MAX_SPEED)
+        self.max_turn_rate = config.get('MAX_TURN_RATE', MAX_TURN_RATE)
+        self.noise = config.get('NOISE', 0.0)
+        self.random = np.random.default_rng(seed)
+
+        self.segments = raycast.load_segments(map) * self.scale
+        self.bot = SimBot(position, direction, self.scale)
+
+        # cells of the bounding box of the map whose centre the bot fits on
+        cell = config.get('CELL', CELL)
+        self.origin = self.segments.reshape(-1, 2).min(axis=0)
+        size = np.ceil((self.segments.reshape(-1, 2).max(axis=0) - self.origin) / cell).astype(int)
+        self.cell = cell
+        centres = self.origin + (np.stack(np.meshgrid(np.arange(size[0]), np.arange(size[1]),
+                                                      indexing='ij'), axis=-1) + 0.5) * cell
+        self.free = wall_distance(self.segments, centres) >= self.radius
+        self.visited = np.zeros_like(self.free)
+
+        self.steps = 0
+        self.collisions = 0  # times the bot ran into a wall
+        self.blocked = 0  # steps the bot could not move for a wall
+        self.moved = True
+        self.visit()
+
+    def visit(self):
+        i, j = ((self.bot.xy - self.origin) // self.cell).astype(int)
+        if 0 <= i < self.visited.shape[0] and 0 <= j < self.visited.shape[1]:
+            self.visited[i, j] = True
+
+    def scan(self):
+        """
+        Returns the distances of one revolution from the current pose, 0 where invalid.
+        """
+        dists = raycast.cast(self.segments, self.bot.xy, raycast.beam_angles(self.bot.theta),
+                             MAX_RANGE + 1)
+        if self.noise > 0:
+            dists = dists + self.random.normal(0, self.noise, dists.shape)
+        dists = np.round(dists).astype(np.int32)
+        dists[(dists < MIN_RANGE) | (dists > MAX_RANGE)] = 0
+        return dists
+
+    def move(self, left, right):
+        """
+        Drives the bot for one revolution, returns False if it hit a wall.
+        """
+        # a positive angle turns clockwise, which drives the right motor value above the left
+        velocity = (left + right) / 2 * self.max_speed
+        turn_rate = (left - right) / 2 * self.max_turn_rate
+
+        dt = self.period / SUBSTEPS
+        for _ in range(SUBSTEPS):
+            theta = self.bot.theta + turn_rate * dt
+            xy = self.bot.xy + velocity * dt * np.array([math.cos(theta), math.sin(theta)])
+            if wall_distance(self.segments, xy) < self.radius:
+                return False
+            self.bot.theta = theta
+            self.bot.xy = xy
+            self.visit()
+        return True
+
+    def step(self, ai):
+        image = self.scan()
+        decision = ai.decide(self.bot, image, self.map)
+
+        speed = float(np.clip(decision['speed'], -1, 1))
+        angle = float(np.clip(decision['angle'], -1, 1))
+        self.bot.speed = speed
+        self.bot.angle = angle
+        left, right = arcade(speed, angle)
+        left = float(np.clip(left, -1, 1))
+        right = float(np.clip(right, -1, 1))
+
+        if not self.move(left, right):
+            if self.moved:
+                self.collisions += 1
+            self.blocked += 1
+            self.moved = False
+        else:
+            self.moved = True
+        self.steps += 1
+
+    def coverage(self):
+        return float((self.visited & self.free).sum() / max(self.free.sum(), 1))
+
+
+def load_ai(ai_name, ai_config=None):
+    ai_module = __import__(ai_name)
+    if ai_config is not None:
+        return ai_module.AI(ai_config)
+    return ai_module.AI()
+
+
+def run_episode(episode):
+    """
+    Runs one episode, described by a dict of ai, ai_config, map, position, direction,
+    config, steps and seed, and returns its results.
+    """
+    ai = load_ai(episode['ai'], episode.get('ai_config'))
+    sim = Simulator(episode['map'], episode['position'], episode['direction'],
+                    episode.get('config'), episode.get('seed'))
+
+    start = time.perf_counter()
+    for _ in range(episode['steps']):
+        sim.step(ai)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'seed': episode.get('seed'),
+        'steps': sim.steps,
+        'collisions': sim.collisions,
+        'blocked': sim.blocked,
+        'coverage': sim.coverage(),
+        'decisions_per_s': sim.steps / elapsed if elapsed > 0 else 0.0,
+        'speedup': sim.steps * sim.period / elapsed if elapsed > 0 else 0.0,
+        'position': sim.bot.position,
+    }
+
+
+def start_poses(map, position, direction, count, config=None, seed=None):
+    """
+    Returns count start poses: the given one, then random free ones.
+    """
+    random = np.random.default_rng(seed)
+    sim = Simulator(map, position, direction, config)
+    cells = np.argwhere(sim.free)
+    poses = [(list(position), list(direction))]
+    while len(poses) < count:
+        i, j = cells[random.integers(len(cells))]
+        xy = (sim.origin + (np.array([i, j]) + 0.5) * sim.cell) / sim.scale
+        theta = random.uniform(-math.pi, math.pi)
+        poses.append((list(xy), [math.cos(theta), math.sin(theta)]))
+    return poses
+
+
+def simulate(ai_name, map, position, direction, episodes=1, steps=1000, ai_config=None,
+             config=None, seed=0, workers=None):
+    """
+    Runs episodes of an AI in parallel, returns the results of every episode.
+    """
+    jobs = [{'ai': ai_name, 'ai_config': ai_config, 'map': map, 'position': pose[0],
+             'direction': pose[1], 'config': config, 'steps': steps, 'seed': seed + i}
+            for i, pose in enumerate(start_poses(map, position, direction, episodes, config, seed))]
+    if workers == 1 or episodes == 1:
+        return [run_episode(job) for job in jobs]
+    with ProcessPoolExecutor(workers) as pool:
+        return list(pool.map(run_episode, jobs))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run an AI module in a simulated world.')
+    parser.add_argument('--config', default=os.environ.get('BOT_CONFIG', 'data/config.json'))
+    parser.add_argument('--ai', help='AI module, AI by default')
+    parser.add_argument('--episodes', type=int, default=4)
+    parser.add_argument('--steps', type=int, default=1000, help='revolutions per episode')
+    parser.add_argument('--workers', type=int, help='processes, one per CPU by default')
+    parser.add_argument('--noise', type=float, help='distance noise in mm')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args()
+
+    with open(args.config) as config_file:
+        config = json.load(config_file)
+    map_name = os.path.join(os.path.dirname(args.config), config['MAP'])
+    with open(map_name) as map_file:
+        map = json.load(map_file)
+
+    sim_config = dict(config.get('SIMULATOR', {}))
+    if args.noise is not None:
+        sim_config['NOISE'] = args.noise
+
+    start = time.perf_counter()
+    results = simulate(args.ai or config['AI'], map, config['START_POS'], config['START_DIR'],
+                       args.episodes, args.steps, config.get('AI_CONFIG'), sim_config,
+                       args.seed, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print('{:>7} {:>7} {:>10} {:>7} {:>8} {:>11} {:>8}'.format(
+        'episode', 'steps', 'collisions', 'blocked', 'coverage', 'decisions/s', 'speedup'))
+    for i, result in enumerate(results):
+        print('{:7d} {:7d} {:10d} {:7d} {:7.1f}% {:11.0f} {:7.0f}x'.format(
+            i, result['steps'], result['collisions'], result['blocked'], result['coverage'] * 100,
+            result['decisions_per_s'], result['speedup']))
+    steps = sum(result['steps'] for result in results)
+    print('{} decisions in {:.2f} s, {:.0f} decisions/s, {} collisions, {:.1f}% mean coverage'.format(
+        steps, elapsed, steps / elapsed, sum(result['collisions'] for result in results),
+        100 * np.mean([result['coverage'] for result in results])))
+
+    if args.json:
+        with open(args.json, 'w') as json_file:
+            json.dump(results, json_file, indent=2)
@@ -0,0 +1,105 @@
+"""
+    Startup
+    =======
+
+    Helpers that keep a (re)start of the bot short: the map is cached in binary form, the
+    address of the motor board found on the I²C bus is remembered, the lidar is started on a
+    thread of its own while everything else initializes, and every phase is timed.
+    """
+
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+import raycast
+
+
+class StartupTimer:
+    """
+    Times the phases of a startup, phases may run on different threads.
+
+    start -- time.perf_counter() the startup began at, now by default
+    """
+
+    def __init__(self, start=None):
+        self.start = time.perf_counter() if start is None else start
+        self.phases = []  # (name, begin, duration), seconds since start
+
+    @contextmanager
+    def phase(self, name):
+        begin = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.phases.append((name, begin - self.start, end - begin))
+
+    def report(self):
+        """
+        Returns one line per phase, in the order they began, and the total.
+        """
+        lines = ['{:>12} {:8.1f} ms  (at {:7.1f} ms)'.format(name, duration * 1000, begin * 1000)
+                 for name, begin, duration in sorted(self.phases, key=lambda p: p[1])]
+        lines.append('{:>12} {:8.1f} ms'.format('total', (time.perf_counter() - self.start) * 1000))
+        return '\n'.join(lines)
+
+
+def load_map(map_name, cache_dir):
+    """
+    Returns the wall segments of a map.json file as an array of shape (N, 2, 2).
+
+    The array is cached in cache_dir under the hash of the file, so an edited map is parsed
+    again while an unchanged one is loaded straight from its binary form.
+    """
+    with open(map_name, 'rb') as map_file:
+        data = map_file.read()
+    cache_name = os.path.join(cache_dir, 'map-{}.npy'.format(hashlib.sha1(data).hexdigest()))
+    try:
+        return np.load(cache_name)
+    except (OSError, ValueError):
+        pass
+
+    segments = raycast.load_segments(json.loads(data))
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temporary file first, a crash never leaves a truncated cache behind
+    with open(cache_name + '.tmp', 'wb') as cache_file:
+        np.save(cache_file, segments)
+    os.replace(cache_name + '.tmp', cache_name)
+    return segments
+
+
+def load_board_address(path):
+    """
+    Returns the I²C address of the motor board remembered in path, or None.
+    """
+    try:
+        with open(path) as address_file:
+            return int(address_file.read(), 16)
+    except (OSError, ValueError):
+        return None
+
+
+def save_board_address(path, address):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as address_file:
+        address_file.write('%02X\n' % address)
+
+
+def start_lidar(config, timer):
+    """
+    Creates the LIDAR_MODULE lidar on a thread of its own, returns a future of it.
+
+    Its reader starts collecting the first revolution while the rest of the bot initializes.
+    """
+    def create():
+        with timer.phase('lidar'):
+            return __import__(config['LIDAR_MODULE']).Lidar(config.get('LIDAR_CONFIG'))
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    future = executor.submit(create)
+    executor.shutdown(wait=False)
+    return future
@@ -0,0 +1,137 @@
+"""
+    Binary telemetry
+    ================
+
+    The control loop records one fixed-layout RECORD_DTYPE record per cycle into a ring buffer.
+    A background thread appends new records to a file, rotating it once it grows past MAX_BYTES.
+    Files start with MAGIC followed by the raw records, telemetry_dump.py prints them.
+
+    The ring has a single writer and a single reader: the writer fills a slot before moving
+    the head, the reader only reads slots behind the head, so neither takes a lock. Records
+    the reader could not flush before the writer came around again are counted as lost.
+    """
+
+import os
+import threading
+import time
+import numpy as np
+
+MAGIC = b'BOTTELE1'
+
+RECORD_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('seq', '<u4'),  # lidar revolution the decision was made on
+    ('speed', '<f4'),
+    ('angle', '<f4'),
+    ('left', '<f4'),
+    ('right', '<f4'),
+    ('scan_wait', '<f4'),  # seconds spent waiting for the revolution
+    ('decide', '<f4'),  # seconds spent in AI.decide
+    ('drive', '<f4'),  # seconds spent sending the motor command
+])
+
+CAPACITY = 4096  # records, a power of two
+MAX_BYTES = 1 << 20
+BACKUPS = 3
+FLUSH_INTERVAL = 1.0  # seconds
+
+
+class Telemetry:
+    """
+    config -- the TELEMETRY setting:
+        PATH -- file the records are written to
+        MAX_BYTES -- size after which the file is rotated to PATH.1, PATH.2, ...
+        BACKUPS -- number of rotated files kept
+        CAPACITY -- records held in the ring buffer, a power of two
+        FLUSH_INTERVAL -- seconds between two flushes
+    """
+
+    def __init__(self, config):
+        self.path = config['PATH']
+        self.max_bytes = config.get('MAX_BYTES', MAX_BYTES)
+        self.backups = config.get('BACKUPS', BACKUPS)
+        self.flush_interval = config.get('FLUSH_INTERVAL', FLUSH_INTERVAL)
+
+        capacity = config.get('CAPACITY', CAPACITY)
+        if capacity <= 0 or capacity & (capacity - 1):
+            # records are placed by masking the counters
+            raise ValueError('CAPACITY {} is not a power of two'.format(capacity))
+        self.ring = np.zeros(capacity, dtype=RECORD_DTYPE)
+        self.mask = capacity - 1
+        self.head = 0  # next record to write, only moved by the writer
+        self.tail = 0  # next record to flush, only moved by the reader
+        self.lost = 0
+
+        self.file = self.open()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def record(self, seq, speed, angle, left, right, scan_wait, decide, drive):
+        """
+        Stores one record, never blocks.
+        """
+        self.ring[self.head & self.mask] = (time.time(), seq, speed, angle, left, right,
+                                            scan_wait, decide, drive)
+        self.head += 1
+
+    def open(self):
+        telemetry_file = open(self.path, 'ab')
+        if telemetry_file.tell() == 0:
+            telemetry_file.write(MAGIC)
+        return telemetry_file
+
+    def rotate(self):
+        self.file.close()
+        for i in range(self.backups - 1, 0, -1):
+            if os.path.exists('{}.{}'.format(self.path, i)):
+                os.replace('{}.{}'.format(self.path, i), '{}.{}'.format(self.path, i + 1))
+        if self.backups > 0:
+            os.replace(self.path, '{}.1'.format(self.path))
+        else:
+            os.remove(self.path)
+        self.file = self.open()
+
+    def flush(self):
+        head = self.head
+        if head - self.tail > len(self.ring):
+            # the writer lapped us, the oldest records are gone
+            self.lost += head - self.tail - len(self.ring)
+            self.tail = head - len(self.ring)
+
+        start = self.tail & self.mask
+        count = head - self.tail
+        if start + count <= len(self.ring):
+            chunks = [self.ring[start:start + count]]
+        else:
+            chunks = [self.ring[start:], self.ring[:(head & self.mask)]]
+
+        for chunk in chunks:
+            self.file.write(chunk.tobytes())
+        self.file.flush()
+        self.tail = head
+
+        if self.file.tell() >= self.max_bytes:
+            self.rotate()
+
+    def run(self):
+        while not self.stopped.wait(self.flush_interval):
+            self.flush()
+        self.flush()
+        self.file.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+
+
+def read_telemetry(path):
+    """
+    Returns the records of a telemetry file as an array of RECORD_DTYPE.
+    """
+    with open(path, 'rb') as telemetry_file:
+        if telemetry_file.read(len(MAGIC)) != MAGIC:
+            raise ValueError('{} is not a telemetry file'.format(path))
+        data = telemetry_file.read()
+    usable = len(data) - len(data) % RECORD_DTYPE.itemsize
+    return np.frombuffer(data[:usable], dtype=RECORD_DTYPE)
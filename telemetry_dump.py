@@ -0,0 +1,24 @@
+"""
+    Prints telemetry files written by telemetry.py, oldest first.
+
+    $ python3 telemetry_dump.py telemetry.bin.1 telemetry.bin
+    """
+
+import argparse
+from telemetry import read_telemetry
+
+HEADER = '{:>17} {:>7} {:>6} {:>6} {:>6} {:>6} {:>9} {:>9} {:>9}'
+ROW = '{:17.6f} {:7d} {:6.2f} {:6.2f} {:6.2f} {:6.2f} {:9.3f} {:9.3f} {:9.3f}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Print telemetry records.')
+    parser.add_argument('files', nargs='+')
+    args = parser.parse_args()
+
+    print(HEADER.format('time', 'seq', 'speed', 'angle', 'left', 'right',
+                        'wait ms', 'decide ms', 'drive ms'))
+    for path in args.files:
+        for r in read_telemetry(path):
+            print(ROW.format(r['time'], r['seq'], r['speed'], r['angle'], r['left'], r['right'],
+                             r['scan_wait'] * 1000, r['decide'] * 1000, r['drive'] * 1000))
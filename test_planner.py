@@ -0,0 +1,98 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+from planner import Planner
+
+MAP = os.path.join(os.path.dirname(__file__), 'data', 'map.json')
+GOAL = [100, 100]
+START = [50, 50]
+
+
+@pytest.fixture(scope='module')
+def map():
+    with open(MAP) as map_file:
+        return np.array(json.load(map_file), dtype=np.float64)
+
+
+@pytest.fixture
+def planner(map):
+    return Planner(map, {'GOAL': GOAL})
+
+
+def fresh_cost(map, blocked, position):
+    """
+    Plans every cell from scratch around blocked, returns the cost of the cell of position.
+    """
+    fresh = Planner(map, {'GOAL': GOAL})
+    fresh.blocked = blocked.copy()
+    fresh.blocked[fresh.goal] = False
+    fresh.plan()
+    return fresh.cost[fresh.cell(position)] * fresh.resolution
+
+
+def block(planner, cell, reach):
+    blocked = np.zeros(planner.shape, dtype=bool)
+    blocked[cell[0] - reach:cell[0] + reach + 1, cell[1] - reach:cell[1] + reach + 1] = True
+    return blocked
+
+
+def test_clear_path_only_expands_the_path(planner):
+    planner.distance_to_goal(START)
+    assert planner.complete
+    assert planner.expanded < len(planner.path)
+
+
+def test_obstacle_on_path_near_goal(map, planner):
+    planner.distance_to_goal(START)
+    blocked = block(planner, planner.path[-15], 1)
+
+    planner.update_obstacles(blocked)
+    distance = planner.distance_to_goal(START)
+
+    assert distance == pytest.approx(fresh_cost(map, blocked, START))
+    # a full plan expands every reachable cell
+    assert planner.expanded < 0.1 * np.isfinite(planner.cost).sum()
+
+
+def test_obstacle_off_path_keeps_path(planner):
+    planner.distance_to_goal(START)
+    path = list(planner.path)
+    off_path = next(cell for cell in zip(*np.nonzero(planner.static_free))
+                    if min(abs(cell[0] - i) + abs(cell[1] - j) for i, j in path) > 20)
+
+    planner.update_obstacles(block(planner, off_path, 2))
+    planner.next_waypoint(START)
+
+    assert planner.path == path
+
+
+def test_search_is_capped(planner):
+    planner.expansions = 50
+    planner.distance_to_goal(START)
+    blocked = block(planner, planner.path[len(planner.path) // 2], 6)
+
+    planner.update_obstacles(blocked)
+    waypoint = planner.next_waypoint(START)
+
+    assert planner.expanded <= 50
+    assert not planner.complete
+    assert waypoint is not None
+
+
+def test_matches_fresh_plan(map, planner):
+    random = np.random.default_rng(1)
+    start = planner.cell(START)
+    for _ in range(10):
+        blocked = np.zeros(planner.shape, dtype=bool)
+        for _ in range(3):
+            i, j = random.integers(0, planner.shape[0]), random.integers(0, planner.shape[1])
+            reach = random.integers(1, 8)
+            blocked[max(i - reach, 0):i + reach + 1, max(j - reach, 0):j + reach + 1] = True
+        blocked[start] = False
+
+        planner.expansions = 10 ** 6
+        planner.update_obstacles(blocked)
+        assert planner.distance_to_goal(START) == pytest.approx(fresh_cost(map, blocked, START))
@@ -0,0 +1,30 @@
+import numpy as np
+import pytest
+
+from scan import ScanFrame
+from wall import find_walls
+
+Z = 1000.0  # mm, the wall runs along z = Z
+
+
+@pytest.fixture
+def frame():
+    # a straight wall seen from 50 to 130 degrees, nothing elsewhere
+    angles = np.arange(50, 131)
+    image = np.zeros((360, 2), dtype=np.int32)
+    image[angles, 0] = np.round(Z / np.sin(np.radians(angles)))
+    image[angles, 1] = 100
+    return ScanFrame(image)
+
+
+def test_wall_ends_are_samples_on_the_wall(frame):
+    walls = find_walls(frame)
+
+    assert walls
+    _, _, points = frame.filtered()
+    for wall in walls:
+        for end in (wall.start, wall.end):
+            # every sample keeps its own angle, the end is not a distance at its neighbour's
+            assert any(np.array_equal(end, point) for point in points)
+            assert end[1] == pytest.approx(Z, abs=1.0)
+
@@ -0,0 +1,47 @@
+from bisect import bisect_left
+
+# upper edges of the histogram buckets, in milliseconds
+BUCKETS_MS = [0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000]
+
+
+class Histogram:
+    """
+    Counts durations in buckets, the last bucket holds everything above the last edge.
+    """
+
+    def __init__(self, edges_ms=BUCKETS_MS):
+        self.edges_ms = list(edges_ms)
+        self.counts = [0] * (len(self.edges_ms) + 1)
+        self.total = 0
+        self.max = 0.0
+
+    def add(self, seconds):
+        ms = seconds * 1000.0
+        self.counts[bisect_left(self.edges_ms, ms)] += 1
+        self.total += 1
+        if ms > self.max:
+            self.max = ms
+
+    def percentile(self, p):
+        """
+        Returns the upper edge in milliseconds of the bucket holding the p-th percentile, or
+        the largest duration seen if that is smaller.
+        """
+        if self.total == 0:
+            return 0.0
+        rank = p / 100.0 * self.total
+        seen = 0
+        for edge, count in zip(self.edges_ms, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(edge, self.max)
+        return self.max
+
+    def snapshot(self):
+        return {
+            'buckets_ms': self.edges_ms,
+            'counts': list(self.counts),
+            'p50_ms': self.percentile(50),
+            'p99_ms': self.percentile(99),
+            'max_ms': self.max,
+        }
@@ -0,0 +1,170 @@
+"""
+    Vector Field Histogram AI
+    =========================
+
+    Every revolution is reduced to a polar histogram of obstacle density: each valid reading
+    has a magnitude that grows as the obstacle gets closer than WINDOW, weighted by the signal
+    strength of the reading, and a sector takes the largest magnitude of the readings it would
+    bring the bot within RADIUS of. The histogram is smoothed over neighbouring sectors,
+    sectors below THRESHOLD are free, and the bot steers into the free valley closest to
+    straight ahead: to its centre if it is narrow, WIDE / 2 sectors into it if it is wide.
+
+    angle is the clockwise angle in radians to the chosen direction, clipped to [-1, 1], and
+    speed falls with the density ahead and with how far the bot has to turn.
+
+    Signal strengths are read from bot.qualities when the bot has them, LidarBot sets them
+    every revolution; otherwise every reading counts fully.
+    """
+
+import math
+import time
+import numpy as np
+
+from raycast import FORWARD_INDEX
+from timing import Histogram
+
+SECTORS = 72  # 5 degrees each
+WINDOW = 800.0  # mm, readings farther away are no obstacle
+RADIUS = 110.0  # mm, radius of the bot plus a safety margin
+SMOOTH = 1  # sectors on each side averaged into a sector
+THRESHOLD = 0.4  # smoothed density below which a sector is free
+WIDE = 8  # sectors from which on a valley is wide
+QUALITY = 100.0  # signal strength from which on a reading counts fully
+MIN_WEIGHT = 0.3  # weight of a reading without signal strength, e.g. a weak one
+MAX_SPEED = 0.6
+DENSITY_STOP = 0.5  # density ahead at which the bot stops
+
+
+class AI:
+    """
+    config -- optional dict, the AI_CONFIG setting:
+        SECTORS -- sectors of the histogram
+        WINDOW -- mm from which on readings are ignored
+        RADIUS -- radius of the bot plus a safety margin in mm
+        SMOOTH -- sectors on each side averaged into a sector
+        THRESHOLD -- smoothed density below which a sector is free
+        WIDE -- sectors from which on a valley is wide
+        MAX_SPEED -- speed in a clear straight valley
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.sectors = config.get('SECTORS', SECTORS)
+        self.window = config.get('WINDOW', WINDOW)
+        self.radius = config.get('RADIUS', RADIUS)
+        self.smooth = config.get('SMOOTH', SMOOTH)
+        self.threshold = config.get('THRESHOLD', THRESHOLD)
+        self.wide = config.get('WIDE', WIDE)
+        self.max_speed = config.get('MAX_SPEED', MAX_SPEED)
+
+        self.kernel = np.full(2 * self.smooth + 1, 1.0 / (2 * self.smooth + 1))
+        self.histogram = np.zeros(self.sectors)
+
+        # seconds spent in the last decide, and all of them
+        self.decide_time = 0.0
+        self.decide_times = Histogram()
+
+    def build_histogram(self, image, qualities=None):
+        """
+        Returns the smoothed obstacle density of every sector, sector k centred on sample
+        k * len(image) / SECTORS so the front sample is centred in its sector.
+        """
+        image = np.asarray(image, dtype=np.float64)
+        size = len(image)
+        valid = np.flatnonzero((image > 0) & (image < self.window))
+        dists = image[valid]
+        magnitude = (1.0 - dists / self.window) ** 2
+        if qualities is not None:
+            quality = np.asarray(qualities, dtype=np.float64)[valid]
+            magnitude *= MIN_WEIGHT + (1.0 - MIN_WEIGHT) * np.minimum(quality / QUALITY, 1.0)
+
+        # a reading blocks every sector the bot would hit it in, so obstacles are widened by
+        # the angle the radius of the bot spans at their distance
+        spread = np.degrees(np.arcsin(np.minimum(self.radius / dists, 1.0))) + 180.0 / self.sectors
+        angles = valid * 360.0 / size
+        step = 360.0 / self.sectors
+        first = np.ceil((angles - spread) / step).astype(np.intp)
+        counts = np.minimum(np.floor((angles + spread) / step).astype(np.intp) - first + 1, self.sectors)
+
+        # the sectors of every reading one after the other, a few per reading
+        starts = np.repeat(np.cumsum(counts) - counts, counts)
+        sectors = (np.repeat(first, counts) + np.arange(len(starts)) - starts) % self.sectors
+        density = np.zeros(self.sectors)
+        np.maximum.at(density, sectors, np.repeat(magnitude, counts))
+
+        # circular moving average
+        wrapped = np.concatenate([density[-self.smooth:], density, density[:self.smooth]]) \
+            if self.smooth > 0 else density
+        return np.convolve(wrapped, self.kernel, mode='valid')
+
+    def steer(self, histogram):
+        """
+        Returns the sector to head for, None if every sector is blocked.
+        """
+        free = histogram < self.threshold
+        if not free.any():
+            return None
+        forward = FORWARD_INDEX * self.sectors // 360
+        if free.all():
+            return forward
+
+        # valleys as runs of free sectors, rotated so no run wraps around the end
+        first_blocked = int(np.argmin(free))
+        rotated = np.roll(free, -first_blocked)
+        edges = np.diff(np.concatenate([[0], rotated.astype(np.int8), [0]]))
+        starts = np.flatnonzero(edges == 1)
+        stops = np.flatnonzero(edges == -1)  # exclusive
+
+        best, best_cost = None, math.inf
+        for start, stop in zip(starts, stops):
+            width = stop - start
+            if width >= self.wide:
+                # wide valley: keep WIDE / 2 sectors away from its borders
+                low = start + self.wide // 2
+                high = stop - 1 - self.wide // 2
+                candidate = int(np.clip((forward - first_blocked) % self.sectors, low, high))
+            else:
+                candidate = (start + stop - 1) // 2
+            candidate = (candidate + first_blocked) % self.sectors
+            cost = abs((candidate - forward + self.sectors // 2) % self.sectors - self.sectors // 2)
+            if cost < best_cost:
+                best, best_cost = candidate, cost
+        return best
+
+    def decide(self, bot, image, map):
+        """
+        Takes a list of distances to nearby obstacles and computes move parameters.
+        :param image: np.array of distances from surrounding obstacles as measured by a 360-degree LIDAR
+        :returns angle: the clockwise angle (radians) to the chosen direction
+        :returns speed: scales the bot's velocity
+        :returns message: message to show as a label by the bot
+        """
+        start = time.perf_counter()
+        self.histogram = self.build_histogram(image, getattr(bot, 'qualities', None))
+        target = self.steer(self.histogram)
+
+        if target is None:
+            # boxed in, turn on the spot until a valley opens up
+            angle = 1.0
+            speed = 0.0
+            message = 'blocked'
+        else:
+            forward = FORWARD_INDEX * self.sectors // 360
+            offset = (target - forward + self.sectors // 2) % self.sectors - self.sectors // 2
+            # samples go clockwise, so a sector past the front one is to the right
+            heading = math.radians(offset * 360.0 / self.sectors)
+            angle = float(np.clip(heading, -1, 1))
+            clearance = max(0.0, 1.0 - self.histogram[target] / DENSITY_STOP)
+            speed = float(self.max_speed * clearance * max(0.0, math.cos(heading)))
+            message = 'heading:{:3.0f}'.format(math.degrees(heading))
+        message += '\nspeed:{:2.0f}'.format(speed * 100)
+
+        self.decide_time = time.perf_counter() - start
+        self.decide_times.add(self.decide_time)
+        return {'angle': angle, 'speed': speed, 'quote': message}
+
+    def stats(self):
+        return {
+            'decide_time': self.decide_time,
+            'decide_times': self.decide_times.snapshot(),
+        }
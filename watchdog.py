@@ -0,0 +1,92 @@
+"""
+    Staged watchdog
+    ===============
+
+    Every stage of the control loop has a heartbeat with a deadline of its own:
+
+        lidar -- the reader decoded packets
+        scan -- a revolution was handed to the AI
+        ai -- AI.decide is running
+        motor -- a motor command is being written
+
+    beat(stage) arms its deadline, done(stage) disarms it again for stages that are only
+    bounded while they run. A monitor thread checks the deadlines every INTERVAL seconds and
+    turns the motors off as soon as one is missed, naming the stage that missed it.
+
+    A beat is a clock read and a dict store, no lock is taken.
+    """
+
+import threading
+import time
+
+INTERVAL = 0.01  # seconds between two checks of the deadlines
+
+# seconds a stage may go without a beat
+DEADLINES = {
+    'lidar': 0.1,
+    'scan': 1.0,
+    'ai': 0.2,
+    'motor': 0.05,
+}
+
+DISARMED = float('inf')
+
+
+class Watchdog(threading.Thread):
+    """
+    motors_off -- function turning the motors off, called from the monitor thread
+    config -- optional dict, the WATCHDOG setting:
+        LIDAR, SCAN, AI, MOTOR -- deadline of each stage in seconds
+        INTERVAL -- seconds between two checks of the deadlines
+    """
+
+    timed_out = False
+
+    def __init__(self, motors_off, config=None):
+        super(Watchdog, self).__init__(daemon=True)
+        config = config or {}
+        self.motors_off = motors_off
+        self.interval = config.get('INTERVAL', INTERVAL)
+        self.timeouts = {stage: config.get(stage.upper(), deadline)
+                         for stage, deadline in DEADLINES.items()}
+        # stages are armed by their first beat
+        self.deadlines = dict.fromkeys(self.timeouts, DISARMED)
+
+        self.misses = dict.fromkeys(self.timeouts, 0)
+        self.stop_latency = 0.0  # seconds from the last missed deadline to the motors being off
+        self.stopped = threading.Event()
+        self.start()
+
+    def beat(self, stage):
+        self.deadlines[stage] = time.monotonic() + self.timeouts[stage]
+
+    def done(self, stage):
+        self.deadlines[stage] = DISARMED
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            now = time.monotonic()
+            missed = [(stage, now - deadline) for stage, deadline in list(self.deadlines.items())
+                      if now > deadline]
+            if not missed:
+                continue
+
+            self.motors_off()
+            self.stop_latency = time.monotonic() - now + max(late for _, late in missed)
+            self.timed_out = True
+            for stage, late in missed:
+                # wait for the next beat before checking the stage again
+                self.deadlines[stage] = DISARMED
+                self.misses[stage] += 1
+                print('watchdog: {} missed its deadline by {:.0f} ms, motors off'.format(
+                    stage, late * 1000))
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+    def stats(self):
+        return {
+            'misses': dict(self.misses),
+            'stop_latency': self.stop_latency,
+        }